@@ -3,36 +3,155 @@
 Sublime Text 2-3 Plugin to invoke YAPF on a Python file.
 """
 from __future__ import print_function
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
 
-import fnmatch
+import collections
+import json
+import multiprocessing
 import os
 import shlex
 import subprocess
 import sys
-import tempfile
 import textwrap
+import threading
+import time
 
 import sublime
 import sublime_plugin
 
 try:
-    from shutil import which
-except ImportError:
-    from backports.shutil_which import which
+    from .pyyapf_core import inprocess
+    from .pyyapf_core.backends import get_backend
+    from .pyyapf_core.cache import FormatCache, cache_key, user_cache_dir
+    from .pyyapf_core.chunks import (
+        SEAM_PROBE, join_chunks, seam_blank_lines, split_chunks,
+        top_level_block
+    )
+    from .pyyapf_core.client import WorkerError, WorkerPool, python_command
+    from .pyyapf_core.diff import (
+        changed_regions, hunks, map_point, unified_diff
+    )
+    from .pyyapf_core.files import find_python_files, read_source, write_source
+    from .pyyapf_core.jobs import JobQueue
+    from .pyyapf_core.policy import SavePolicy
+    from .pyyapf_core.ranges import merge_ranges, subtract_ranges
+    from .pyyapf_core.runner import run_formatter
+    from .pyyapf_core.stats import LatencyStats, Timings, clock
+    from .pyyapf_core.styles import save_style_to_cache
+    from .pyyapf_core.syntax import syntax_error_lines
+    from .pyyapf_core.watchdog import Killed, Watchdog
+except (ImportError, SystemError, ValueError):
+    # sublime text 2 does not load plugins as packages
+    from pyyapf_core import inprocess
+    from pyyapf_core.backends import get_backend
+    from pyyapf_core.cache import FormatCache, cache_key, user_cache_dir
+    from pyyapf_core.chunks import (
+        SEAM_PROBE, join_chunks, seam_blank_lines, split_chunks,
+        top_level_block
+    )
+    from pyyapf_core.client import WorkerError, WorkerPool, python_command
+    from pyyapf_core.diff import (
+        changed_regions, hunks, map_point, unified_diff
+    )
+    from pyyapf_core.files import find_python_files, read_source, write_source
+    from pyyapf_core.jobs import JobQueue
+    from pyyapf_core.policy import SavePolicy
+    from pyyapf_core.ranges import merge_ranges, subtract_ranges
+    from pyyapf_core.runner import run_formatter
+    from pyyapf_core.stats import LatencyStats, Timings, clock
+    from pyyapf_core.styles import save_style_to_cache
+    from pyyapf_core.syntax import syntax_error_lines
+    from pyyapf_core.watchdog import Killed, Watchdog
 
 # make sure we don't choke on unicode when we reformat ourselves
 u"我爱蟒蛇"
 
 SUBLIME_3 = sys.version_info >= (3, 0)
 KEY = "pyyapf"
+DIRTY_KEY = "pyyapf_dirty"
+PROGRESS_KEY = "pyyapf_progress"
+LATENCY_KEY = "pyyapf_latency"
+CHECK_KEY = "pyyapf_check"
+PREVIEW_PANEL = "pyyapf_preview"
 
 PLUGIN_SETTINGS_FILE = "PyYapf.sublime-settings"
 SUBLIME_SETTINGS_KEY = "PyYapf"
 
+# long-lived yapf processes used by the "worker" engine
+WORKERS = WorkerPool()
+
+# formatting results, keyed by source, style and yapf installation
+CACHE = FormatCache()
+
+# background formatting (e.g. asynchronous format on save)
+JOBS = JobQueue()
+
+# speculative formatting of views that might be saved soon ("pre_format")
+PRE_FORMATS = JobQueue()
+
+# "check_on_idle" and "yapf_check", kept out of the way of JOBS
+CHECKS = JobQueue()
+
+# view id -> (change_count, style, result) of the speculative format
+PRE_FORMATTED = {}
+
+# view id -> result of a background job, waiting to be applied
+ASYNC_RESULTS = {}
+
+# ids of views being saved again after they were formatted in the background
+RESAVING = set()
+
+# view id -> number of lines, used to notice lines inserted by an edit
+LINE_COUNTS = {}
+
+# view id -> change_count right after the document was formatted
+FORMATTED = {}
+
+# window id -> {settings fingerprint: invocation profile}, see Yapf.profile
+PROFILES = {}
+
+# view id -> ViewSettings
+SETTINGS = {}
+
+# on save options -> SavePolicy, see ViewSettings.save_policy
+POLICIES = {}
+
+# window id -> running ProjectFormat
+PROJECT_RUNS = {}
+
+# window id -> views waiting to be formatted by "yapf_all_views"
+ALL_VIEWS_QUEUES = {}
+
+# rolling latency per engine and view, see "yapf_stats"
+STATS = LatencyStats()
+
+# serializes writes to the "trace_file"
+TRACE_LOCK = threading.Lock()
+
+# trace files that could not be written (reported once)
+TRACE_ERRORS = set()
+
+# view id -> (change_count, {(begin, end): syntax check result})
+PREFLIGHT = {}
+
+# view id -> watchdogs of running yapf invocations, see "yapf_cancel"
+IN_FLIGHT = {}
+IN_FLIGHT_LOCK = threading.Lock()
+
+# names of files that took too long to format, see "slow_files_on_save"
+SLOW_FILES = set()
+
+# view id -> change_count when "yapf_check" last ran
+CHECKED = {}
+
+# view id -> number of the latest scheduled check, see schedule_check
+CHECK_SCHEDULED = {}
+
+# view id -> (change_count, (begin, end), result) of the live preview
+PREVIEWS = {}
+
+# view id -> number of the latest scheduled preview, see schedule_preview
+PREVIEW_SCHEDULED = {}
+
 if not SUBLIME_3:
     # backport from python 3.3
     # (https://hg.python.org/cpython/file/3.3/Lib/textwrap.py)
@@ -58,21 +177,23 @@ if not SUBLIME_3:
     textwrap.indent = indent
 
 
-def save_style_to_tempfile(style):
-    """Build yapf style config file."""
-    cfg = configparser.RawConfigParser()
-    cfg.add_section('style')
-    for key, value in style.items():
-        cfg.set('style', key, value)
-
-    # dump it to temporary file
-    fobj, fname = tempfile.mkstemp()
-    cfg.write(os.fdopen(fobj, "w"))
-    return fname
+def cache_dir(*names):
+    """Directory for PyYapf's own files (sublime's cache if available)."""
+    if hasattr(sublime, "cache_path"):
+        return os.path.join(sublime.cache_path(), SUBLIME_SETTINGS_KEY, *names)
+    return user_cache_dir(*names)
 
 
 def dedent_text(text):
     """Strip initial whitespace from text but note how wide it is."""
+    # the indentation of the first line is what gets restored.  if there is
+    # none (always the case for entire documents), there is nothing to strip
+    # and the (possibly huge) text is not copied
+    end = text.find('\n')
+    first_line = text if end < 0 else text[:end]
+    if first_line.strip() and not first_line[0].isspace():
+        return text, '', text.endswith('\n')
+
     new_text = textwrap.dedent(text)
     if not new_text:
         return new_text, '', False
@@ -92,7 +213,8 @@ def dedent_text(text):
 
 def indent_text(text, indent, trailing_nl):
     """Reindent text by `indent` characters."""
-    text = textwrap.indent(text, indent)
+    if indent:
+        text = textwrap.indent(text, indent)
 
     # remove trailing newline if so desired
     if not trailing_nl and text.endswith('\n'):
@@ -101,31 +223,14 @@ def indent_text(text, indent, trailing_nl):
     return text
 
 
-def parse_error_line(err_lines):
-    """Parse YAPF output to determine line on which error occurred."""
-    msg = err_lines[-1]
-
-    # yapf.yapflib.verifier.InternalError:
-    #     Missing parentheses in call to 'print' (<string>, line 2)
-    if '(<string>, line ' in msg:
-        return int(msg.rstrip(')').rsplit(None, 1)[1]) + 1
-
-    # lib2to3.pgen2.tokenize.TokenError: ('EOF in multi-line statement', (5, 0))
-    if msg.endswith('))'):
-        return int(msg.rstrip(')').rsplit(None, 2)[1].strip(',('))
-
-    #   File "<unknown>", line 3
-    #     if:
-    #       ^
-    # SyntaxError: invalid syntax
-    if len(err_lines) >= 4 and ', line' in err_lines[-4]:
-        return int(err_lines[-4].rsplit(None, 1)[1])
-
-
 if SUBLIME_3:
     ERROR_FLAGS = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE | sublime.DRAW_SQUIGGLY_UNDERLINE
+    CHECK_FLAGS = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
+    DIFF_SYNTAX = 'Packages/Diff/Diff.sublime-syntax'
 else:
     ERROR_FLAGS = sublime.DRAW_OUTLINED
+    CHECK_FLAGS = sublime.DRAW_OUTLINED
+    DIFF_SYNTAX = 'Packages/Diff/Diff.tmLanguage'
 
 
 class Yapf:
@@ -135,14 +240,33 @@ class Yapf:
     Includes encoding/decoding and error handling.
     """
 
-    def __init__(self, view):
+    # invocations in another group never wait for each other's workers
+    worker_group = None
+
+    def __init__(self, view, worker_slot=0):
         """We are tied to a specific view (an open file in sublime)."""
         self.view = view
+        self.settings = view_settings(view)
+
+        # the "worker" engine uses one worker per slot
+        self.worker_slot = worker_slot
+
+        # what took how long, and which engine did the work
+        self.timings = Timings()
+        self.engine_used = None
+
+        # "timeout" or "cancelled" if yapf was killed
+        self.kill_reason = None
+
+        # engine -> yapf_identity
+        self.identities = {}
 
     def __enter__(self):
         """Sublime calls plugins 'with' a context manager."""
+        start = clock()
+
         # determine encoding
-        self.encoding = self.view.encoding()
+        self.encoding = self.file_encoding()
         if self.encoding in ['Undefined', None]:
             self.encoding = self.get_setting('default_encoding')
             self.debug(
@@ -152,31 +276,33 @@ class Yapf:
         else:
             self.debug('Encoding is %r', self.encoding)
 
-        # custom style options?
-        custom_style = self.get_setting("config")
-        if custom_style:
-            # write style file to temporary file
-            self.custom_style_fname = save_style_to_tempfile(custom_style)
-            self.debug(
-                'Using custom style (%s):\n%s', self.custom_style_fname,
-                open(self.custom_style_fname).read().strip()
-            )
-        else:
-            self.custom_style_fname = None
-
-        # use shlex.split because we should honor embedded quoted arguemnts
-        self.popen_args = shlex.split(self.find_yapf(), posix=False)
-        if self.custom_style_fname:
-            self.popen_args += ['--style', self.custom_style_fname]
+        # formatter, its command and custom style file
+        self.backend = self.find_backend()
+        profile = self.profile()
+        self.custom_style_fname = profile['style_fname']
+        self.popen_args = list(profile['popen_args'])
+        self.versions = profile['versions']
+        self.seams = profile['seams']
 
-        # use directory of current file so that custom styles are found
-        # properly
-        fname = self.view.file_name()
+        # run yapf in the directory of the current file
+        fname = self.file_name()
         self.popen_cwd = os.path.dirname(fname) if fname else None
 
+        # the "config" setting wins over the project's style
+        if self.custom_style_fname:
+            self.style, self.style_mtime = self.custom_style_fname, None
+        else:
+            self.style, self.style_mtime = self.backend.styles.find(
+                self.popen_cwd
+            )
+        self.debug('Using style %s', self.style)
+
         # specify encoding in environment
-        self.popen_env = os.environ.copy()
-        self.popen_env['LANG'] = str(self.encoding)
+        self.popen_env = profile['envs'].get(self.encoding)
+        if self.popen_env is None:
+            self.popen_env = os.environ.copy()
+            self.popen_env['LANG'] = str(self.encoding)
+            profile['envs'][self.encoding] = self.popen_env
 
         # win32: hide console window
         if sys.platform in ('win32', 'cygwin'):
@@ -186,21 +312,135 @@ class Yapf:
         else:
             self.popen_startupinfo = None
 
+        # size the result cache
+        CACHE.configure(
+            self.get_setting("cache_size", 64),
+            cache_dir('results'),
+            self.get_setting("cache_disk_size", 0) * 1024 * 1024
+        )
+
         # clear marked regions and status
-        self.view.erase_regions(KEY)
-        self.view.erase_status(KEY)
-        self.errors = []
+        self.clear_errors()
+
+        # (begin, old length, new length) of every replacement made
+        self.edits = []
+
+        self.timings.add('setup', clock() - start)
         return self
 
     def __exit__(self, type, value, traceback):
         """Context manager cleanup."""
-        if self.custom_style_fname:
-            os.unlink(self.custom_style_fname)
+        stages = self.timings.stages
+        if 'yapf' in stages or 'apply' in stages:
+            self.record_timings()
+
+    def record_timings(self):
+        """Add this format to the statistics (and the trace file)."""
+        total = self.timings.total()
+        engine = self.engine_used or 'precomputed'
+        STATS.record('engine: %s' % engine, self.timings, total)
+
+        name = self.stats_name()
+        if name is not None:
+            STATS.record('view: %s' % name, self.timings, total)
+            if self.get_setting("show_latency"):
+                self.view.set_status(
+                    LATENCY_KEY, 'PyYapf: %dms (%s)' % (1000 * total, engine)
+                )
+
+        trace_file = self.get_setting("trace_file")
+        if trace_file:
+            entry = {
+                'time': time.time(),
+                'file': self.file_name(),
+                'engine': engine,
+                'total': total,
+                'stages': self.timings.stages
+            }
+            path = os.path.expanduser(trace_file)
+            with TRACE_LOCK:
+                try:
+                    with open(path, 'a') as fp:
+                        fp.write(json.dumps(entry) + '\n')
+                except (IOError, OSError) as err:
+                    # the edit was made already, do not fail it
+                    if path not in TRACE_ERRORS:
+                        TRACE_ERRORS.add(path)
+                        print('PyYapf: Can not write "trace_file": %s' % err)
+
+    def stats_name(self):
+        """Name of the view in the statistics."""
+        return self.file_name() or 'untitled %d' % self.view.id()
+
+    def file_name(self):
+        """Name of the file being formatted (if any)."""
+        return self.view.file_name()
+
+    def file_encoding(self):
+        """Encoding of the file being formatted."""
+        return self.view.encoding()
+
+    def find_backend(self):
+        """Return the backend selected by the "formatter" setting."""
+        name = self.get_setting("formatter")
+        backend = get_backend(name)
+        if backend is None:
+            print('PyYapf: Unknown formatter %r, using yapf' % name)
+            backend = get_backend(None)
+        return backend
+
+    def profile(self):
+        """
+        Return how to invoke the formatter for this view.
+
+        Finding the formatter and writing the custom style file is done once
+        per window and combination of "formatter", its command and "config"
+        settings; all profiles are dropped when the plugin settings change.
+        """
+        window = self.view.window() or sublime.active_window()
+        custom_style = None
+        if self.backend.custom_styles:
+            custom_style = self.get_setting("config")
+        fingerprint = repr((
+            self.backend.name,
+            self.get_setting(self.backend.command_setting),
+            custom_style
+        ))
+
+        profiles = PROFILES.setdefault(window.id(), {})
+        profile = profiles.get(fingerprint)
+        if profile is not None:
+            return profile
+
+        # custom style options?
+        if custom_style:
+            style_fname = save_style_to_cache(custom_style, cache_dir('styles'))
+            self.debug('Using custom style (%s)', style_fname)
+        else:
+            style_fname = None
+
+        # use shlex.split because we should honor embedded quoted arguemnts
+        with self.timings.stage('find_yapf'):
+            popen_args = shlex.split(self.find_yapf(), posix=False)
+
+        profile = {
+            'popen_args': popen_args,
+            'style_fname': style_fname,
+            # encoding -> environment
+            'envs': {},
+            # (engine, ...) -> formatter version, see yapf_identity
+            'versions': {},
+            # (style, style_mtime) -> blank lines between chunks, see run_chunks
+            'seams': {}
+        }
+        profiles[fingerprint] = profile
+        return profile
 
     def find_yapf(self):
-        """Find the yapf executable."""
+        """Find the formatter executable (yapf unless configured otherwise)."""
         # default to what is in the settings file
-        cmd = self.get_setting("yapf_command")
+        setting = self.backend.command_setting
+        cmd = self.get_setting(setting, "")
         cmd = os.path.expanduser(cmd)
 
         # sublime 2.x support per https://github.com/jason-kane/PyYapf/issues/53
@@ -212,140 +452,122 @@ class Yapf:
 
         save_settings = not cmd
 
-        for maybe_cmd in ['yapf', 'yapf3', 'yapf.exe', 'yapf3.exe']:
-            if not cmd:
-                cmd = which(maybe_cmd)
-            if cmd:
-                self.debug('Found yapf: %s', cmd)
-                break
+        cmd = self.backend.find(cmd)
+        if cmd:
+            self.debug('Found %s: %s', self.backend.name, cmd)
 
         if cmd and save_settings:
             settings = sublime.load_settings(PLUGIN_SETTINGS_FILE)
-            settings.set("yapf_command", cmd)
+            settings.set(setting, cmd)
             sublime.save_settings(PLUGIN_SETTINGS_FILE)
 
         return cmd
 
-    def format(self, edit, selection=None):
+    def find_python(self):
+        """Find the python interpreter yapf is installed for."""
+        cmd = self.get_setting("worker_python")
+        if cmd:
+            cmd = os.path.expanduser(cmd)
+            if hasattr(sublime, "expand_variables"):
+                cmd = sublime.expand_variables(
+                    cmd,
+                    sublime.active_window().extract_variables()
+                )
+            return shlex.split(cmd, posix=False)
+
+        # yapf_command may already be a "python -m yapf" style command
+        exe = self.popen_args[0] if self.popen_args else None
+        if not exe:
+            return None
+        if python_command([exe]):
+            return [exe]
+
+        # a yapf script installed by pip, use its shebang (unless it is a
+        # shell script, like the shims of pyenv)
+        try:
+            with open(exe, 'rb') as fp:
+                first = fp.readline(1024).decode('utf-8', 'replace').strip()
+        except (IOError, OSError):
+            first = ''
+        if first.startswith('#!'):
+            return python_command(shlex.split(first[2:], posix=False))
+
+        # win32: Scripts\yapf.exe lives next to (or below) python.exe
+        scripts = os.path.dirname(exe)
+        for folder in (scripts, os.path.dirname(scripts)):
+            python = os.path.join(folder, 'python.exe')
+            if os.path.isfile(python):
+                return [python]
+        return None
+
+    def format(self, edit, selection=None, result=None, lines=None):
         """
         Format selection (if None then formats the entire document).
 
+        If given, `result` is what `run` returned for the selection (e.g.
+        when yapf was run in the background) and yapf is not run again.
+        `lines` restricts yapf to these (start, end) line ranges.
+
         Returns region containing the reformatted text.
         """
         # determine selection to format
-        if not selection:
+        entire_document = not selection
+        if entire_document:
             selection = sublime.Region(0, self.view.size())
         self.debug('Formatting selection %r', selection)
 
         # retrieve selected text & dedent
-        text = self.view.substr(selection)
-        text, indent, trailing_nl = dedent_text(text)
+        with self.timings.stage('prepare'):
+            original = self.view.substr(selection)
+            text, indent, trailing_nl = dedent_text(original)
         self.debug('Detected indent %r', indent)
 
-        # encode text
-        try:
-            encoded_text = text.encode(self.encoding)
-        except UnicodeEncodeError as err:
-            msg = (
-                "You may need to re-open this file with a different encoding."
-                " Current encoding is %r." % self.encoding
-            )
-            self.error("UnicodeEncodeError: %s\n\n%s", err, msg)
+        if result is None:
+            result = self.preflight(text, selection)
+        if result is None:
+            result = self.run(text, lines)
+            if entire_document and lines is None:
+                self.note_speed()
+        if result is None:
             return
+        text, err_lines = result
 
-        # pass source code to be formatted on stdin?
-        if self.get_setting("use_stdin"):
-            # run yapf
-            self.debug('Running %s in %s', self.popen_args, self.popen_cwd)
-            try:
-                popen = subprocess.Popen(
-                    self.popen_args,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    stdin=subprocess.PIPE,
-                    cwd=self.popen_cwd,
-                    env=self.popen_env,
-                    startupinfo=self.popen_startupinfo
-                )
-            except OSError as err:
-                # always show error in popup
-                msg = "You may need to install YAPF and/or configure 'yapf_command' in PyYapf's Settings."
-                sublime.error_message("OSError: %s\n\n%s" % (err, msg))
-                return
-            encoded_stdout, encoded_stderr = popen.communicate(encoded_text)
-            text = encoded_stdout.decode(self.encoding)
-        else:
-            # do _not_ use stdin. this avoids a unicode defect in yapf, see
-            # https://github.com/google/yapf/pull/145. the downside is that
-            # .style.yapf / setup.cfg configuration is not picked up properly,
-            # see https://github.com/jason-kane/PyYapf/issues/36.
-            # we may permanently use stdin and remove the use_stdin option and
-            # this code once the upstream bug is fixed.
-            file_obj, temp_filename = tempfile.mkstemp(suffix=".py")
-            try:
-                temp_handle = os.fdopen(file_obj, 'wb' if SUBLIME_3 else 'w')
-                temp_handle.write(encoded_text)
-                temp_handle.close()
-                self.popen_args += ["--in-place", temp_filename]
-
-                self.debug('Running %s in %s', self.popen_args, self.popen_cwd)
-                try:
-                    popen = subprocess.Popen(
-                        self.popen_args,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        cwd=self.popen_cwd,
-                        env=self.popen_env,
-                        startupinfo=self.popen_startupinfo
-                    )
-                except OSError as err:
-                    # always show error in popup
-                    msg = "You may need to install YAPF and/or configure 'yapf_command' in PyYapf's Settings."
-                    sublime.error_message("OSError: %s\n\n%s" % (err, msg))
-                    return
-
-                encoded_stdout, encoded_stderr = popen.communicate()
-
-                if SUBLIME_3:
-                    open_encoded = open
-                else:
-                    import codecs
-                    open_encoded = codecs.open
-
-                with open_encoded(temp_filename, encoding=self.encoding) as fp:
-                    text = fp.read()
-            finally:
-                os.unlink(temp_filename)
-
-        self.debug('Exit code %d', popen.returncode)
-
-        # handle errors (since yapf>=0.3, exit code 2 means changed, not error)
-        if popen.returncode not in (0, 2):
-            stderr = encoded_stderr.decode(self.encoding)
-            stderr = stderr.replace(os.linesep, '\n')
-            self.debug('Error:\n%s', stderr)
-
+        if err_lines:
             # report error
-            err_lines = stderr.splitlines()
             msg = err_lines[-1]
             self.error('%s', msg)
 
             # attempt to highlight line where error occurred
-            rel_line = parse_error_line(err_lines)
+            rel_line, column = self.backend.error_position(err_lines)
             if rel_line:
                 line = self.view.rowcol(selection.begin())[0]
                 pt = self.view.text_point(line + rel_line - 1, 0)
                 region = self.view.line(pt)
+
+                # and from the column on, if known
+                if column:
+                    begin = max(region.begin(), selection.begin())
+                    begin = min(begin + len(indent) + column - 1, region.end())
+                    if begin < region.end():
+                        region = sublime.Region(begin, region.end())
                 self.view.add_regions(KEY, [region], KEY, 'cross', ERROR_FLAGS)
             return
 
-        # adjust newlines (only necessary when use_stdin is True, since
-        # [codecs.]open uses universal newlines by default)
-        text = text.replace(os.linesep, '\n')
-
-        # re-indent and replace text
-        text = indent_text(text, indent, trailing_nl)
-        self.view.replace(edit, selection, text)
+        # these lines are formatted now, forget they were modified
+        if entire_document:
+            forget_modified_lines(self.view, lines)
+            if lines is None:
+                self.view.erase_regions(CHECK_KEY)
+                self.view.erase_status(CHECK_KEY)
+
+        # re-indent and replace text (unless nothing changed)
+        with self.timings.stage('apply'):
+            text = indent_text(text, indent, trailing_nl)
+            if text != original:
+                self.replace(edit, selection.begin(), original, text)
+            else:
+                self.debug('Already formatted, leaving buffer untouched')
+        FORMATTED[self.view.id()] = self.view.change_count()
 
         # return region containing modified text
         if selection.a <= selection.b:
@@ -353,11 +575,479 @@ class Yapf:
         else:
             return sublime.Region(selection.b + len(text), selection.b)
 
+    def replace(self, edit, begin, old, new):
+        """
+        Replace `old` (which starts at `begin`) by `new`.
+
+        Only lines that actually changed are replaced, which keeps undo
+        history small and leaves regions, bookmarks and folds elsewhere
+        alone.
+        """
+        edits = hunks(old, new)
+        for start, end, text in edits:
+            region = sublime.Region(begin + start, begin + end)
+            self.view.replace(edit, region, text)
+            self.edits.append((begin + start, end - start, len(text)))
+        self.debug('Replaced %d hunk(s)', len(edits))
+
+    def map_region(self, region):
+        """Map a region from before formatting to where it is now."""
+        a, b = region.a, region.b
+        for edit in self.edits:
+            a = map_point(a, *edit)
+            b = map_point(b, *edit)
+        return sublime.Region(a, b)
+
+    def run(self, text, lines=None):
+        """
+        Run yapf on (dedented) text with the configured engine.
+
+        `lines` optionally restricts formatting to (start, end) line ranges.
+        Returns (text, err_lines) or None if yapf could not be run at all.
+        Successful results are cached.
+        """
+        engine = self.planned_engine()
+        key = self.cache_key(text, lines, engine)
+        if self.kill_reason:
+            # while looking up the formatter version
+            return self.killed(self.kill_reason)
+        if key is not None:
+            cached = CACHE.get(key)
+            self.debug('Cache: %s', CACHE.stats())
+            if cached is not None:
+                self.debug('Using cached result')
+                self.engine_used = 'cache'
+                return cached, None
+
+        with self.timings.stage('yapf'):
+            result = None
+            chunks = self.chunks(text) if lines is None else None
+            if chunks:
+                result = self.run_chunks(chunks)
+            if result is None:
+                result = self.run_engine(text, lines)
+
+        if key is not None and result is not None and not result[1]:
+            if self.engine_used != engine:
+                # the engine failed and another one did the work
+                key = self.cache_key(text, lines, self.engine_used)
+            CACHE.put(key, result[0])
+        return result
+
+    def check_syntax(self, text):
+        """
+        Look for syntax errors without running yapf.
+
+        Returns (None, err_lines) like `run` if there is one, otherwise None.
+        """
+        if not self.get_setting("syntax_preflight"):
+            return None
+        err_lines = syntax_error_lines(text)
+        if err_lines is None:
+            return None
+        self.debug('Syntax error: %s', err_lines[0])
+        return None, err_lines
+
+    def preflight(self, text, selection):
+        """Check the syntax of `selection`, once per change of the view."""
+        change_count = self.view.change_count()
+        cached = PREFLIGHT.get(self.view.id())
+        if cached is None or cached[0] != change_count:
+            cached = PREFLIGHT[self.view.id()] = (change_count, {})
+        region = (selection.begin(), selection.end())
+        if region not in cached[1]:
+            cached[1][region] = self.check_syntax(text)
+        return cached[1][region]
+
+    def cache_key(self, text, lines=None, engine=None):
+        """
+        Key of the formatting result for text in the result cache.
+
+        `engine` defaults to the one that is going to run.  Returns None if
+        caching is disabled.
+        """
+        if not CACHE.enabled():
+            return None
+        return cache_key(
+            text,
+            lines,
+            self.style,
+            self.style_mtime,
+            self.yapf_identity(engine)
+        )
+
+    def planned_engine(self):
+        """The engine run_engine is going to use."""
+        engine = self.get_setting("engine")
+        if not self.backend.api:
+            return "process"
+        if engine == "api" and inprocess.available(self.site_packages()):
+            return "api"
+        if engine == "worker":
+            python_args = self.find_python()
+            if python_args and WORKERS.usable(python_args):
+                return "worker"
+        return "process"
+
+    def run_engine(self, text, lines=None, slot=None):
+        """Run yapf with the configured engine, falling back to "process"."""
+        result = None
+        engine = self.get_setting("engine")
+        if engine in ("api", "worker") and self.backend.api:
+            self.engine_used = engine
+            if engine == "api":
+                result = self.run_api(text, lines)
+            else:
+                result = self.run_worker(text, lines, slot)
+        if result is None:
+            self.engine_used = "process"
+            result = self.run_process(text, lines)
+        return result
+
+    def chunks(self, text):
+        """Split a very large document to format it in parallel, or None."""
+        threshold = self.get_setting("parallel_format_lines", 0)
+        if not threshold or text.count('\n') < threshold:
+            return None
+        if not self.backend.chunks:
+            # e.g. ruff puts no blank lines between stubs, seams vary
+            return None
+        if self.get_setting("engine") == "api" and self.backend.api:
+            # the plugin host runs one yapf at a time anyway
+            return None
+
+        jobs = self.get_setting("parallel_format_jobs", 0)
+        chunks = split_chunks(text, jobs or multiprocessing.cpu_count())
+        if chunks:
+            self.debug('Formatting in %d chunks', len(chunks))
+        return chunks
+
+    def run_chunks(self, chunks):
+        """
+        Format chunks of a document at the same time and join them.
+
+        Every chunk gets its own yapf process (or worker).  The number of
+        blank lines to join them with is found by formatting SEAM_PROBE once
+        per profile and style.  Returns None if anything went wrong, the
+        caller then formats the document as a whole (which also reports
+        errors properly).
+        """
+        results = [None] * len(chunks)
+        seam_key = (self.style, self.style_mtime)
+        blank_lines = self.seams.get(seam_key)
+
+        def work(index):
+            results[index] = self.run_chunk(chunks[index], index)
+
+        threads = []
+        for index in range(1, len(chunks)):
+            thread = threading.Thread(target=work, args=(index,))
+            thread.start()
+            threads.append(thread)
+        work(0)
+        if blank_lines is None:
+            probe = self.run_engine(SEAM_PROBE, slot=self.worker_slot)
+            if probe is not None and not probe[1]:
+                blank_lines = seam_blank_lines(probe[0])
+                self.seams[seam_key] = blank_lines
+        for thread in threads:
+            thread.join()
+
+        if self.kill_reason:
+            # no point in trying the whole document
+            return self.killed(self.kill_reason)
+        if blank_lines is None or any(r is None or r[1] for r in results):
+            self.debug('Formatting in chunks failed')
+            return None
+        text = join_chunks([r[0] for r in results], blank_lines)
+        if text is None:
+            self.debug('Chunks do not fit together')
+            return None
+        return text, None
+
+    def run_chunk(self, text, index):
+        """Format one chunk (with caching), in worker slot `index`."""
+        key = self.cache_key(text)
+        cached = None if key is None else CACHE.get(key)
+        if cached is not None:
+            return cached, None
+        result = self.run_engine(text, slot=self.worker_slot + index)
+        if key is not None and result is not None and not result[1]:
+            CACHE.put(key, result[0])
+        return result
+
+    def yapf_identity(self, engine=None):
+        """
+        Identify the formatter that runs (for the cache key).
+
+        That is the engine and the version of the formatter it runs.
+        Versions are looked up once per profile (and interpreter or
+        site-packages).
+        """
+        engine = engine or self.planned_engine()
+        identity = self.identities.get(engine)
+        if identity is not None:
+            return identity
+
+        if engine == "api":
+            paths = self.site_packages()
+            version_key = ("api", tuple(paths))
+            if version_key not in self.versions:
+                self.versions[version_key] = inprocess.version()
+            command = paths
+        elif engine == "worker":
+            python_args = self.find_python()
+            version_key = ("worker", tuple(python_args))
+            if version_key not in self.versions:
+                version = self.worker_version(python_args)
+                if version is None and not self.kill_reason:
+                    return self.yapf_identity("process")
+                self.versions[version_key] = version
+            command = python_args
+        else:
+            version_key = ("process", )
+            if version_key not in self.versions:
+                watchdog = self.start_watchdog()
+                try:
+                    self.versions[version_key] = self.backend.version(
+                        self.popen_args,
+                        watchdog,
+                        env=self.popen_env,
+                        startupinfo=self.popen_startupinfo
+                    )
+                finally:
+                    self.stop_watchdog(watchdog)
+                if watchdog.fired:
+                    self.kill_reason = watchdog.fired
+            command = self.popen_args
+
+        version = self.versions[version_key]
+        if self.kill_reason:
+            # killed while asking, try again next time
+            self.versions.pop(version_key, None)
+            return [self.backend.name, engine, command, version]
+        self.debug('%s version (%s): %s', self.backend.name, engine, version)
+
+        identity = [self.backend.name, engine, command, version]
+        self.identities[engine] = identity
+        return identity
+
+    def worker_version(self, python_args):
+        """Ask the worker for the version of yapf, None if that fails."""
+        watchdog = self.start_watchdog()
+        try:
+            response = WORKERS.request(
+                self.worker_key(python_args),
+                python_args,
+                {'version': True},
+                watchdog=watchdog,
+                env=self.popen_env,
+                startupinfo=self.popen_startupinfo
+            )
+        except Killed as err:
+            self.kill_reason = err.reason
+            return None
+        except (OSError, WorkerError) as err:
+            self.debug('yapf worker failed: %s', err)
+            return None
+        finally:
+            self.stop_watchdog(watchdog)
+        return response.get('version')
+
+    def worker_key(self, python_args, slot=None):
+        """Key of the worker to use in WORKERS."""
+        return (
+            tuple(python_args),
+            repr(self.get_setting("config")),
+            self.worker_group,
+            self.worker_slot if slot is None else slot
+        )
+
+    def request_message(self, text, lines=None):
+        """Build a request for the worker or in-process engines."""
+        return {
+            'source': text,
+            'style': self.style,
+            'cwd': self.popen_cwd,
+            'filename': self.file_name(),
+            'lines': lines
+        }
+
+    def parse_response(self, response):
+        """Turn a worker or in-process response into (text, err_lines)."""
+        if 'error' in response:
+            self.debug('Error:\n%s', '\n'.join(response['error']))
+            return None, response['error']
+        return response['formatted'], None
+
+    def site_packages(self):
+        """Directories yapf is imported from by the "api" engine."""
+        paths = self.get_setting("yapf_site_packages") or []
+        if not isinstance(paths, list):
+            paths = [paths]
+        return [os.path.expanduser(path) for path in paths]
+
+    def run_api(self, text, lines=None):
+        """
+        Format text by calling yapf_api.FormatCode in the plugin host.
+
+        Returns (text, err_lines) or None if yapf can not be imported, in
+        which case the caller falls back to running yapf as a separate
+        process.
+        """
+        paths = self.site_packages()
+        if not inprocess.available(paths):
+            self.debug('yapf can not be imported from %r', paths)
+            return None
+
+        self.debug('Running yapf in-process')
+        return self.parse_response(inprocess.request(self.request_message(text, lines)))
+
+    def run_worker(self, text, lines=None, slot=None):
+        """
+        Format text using a long-lived yapf worker.
+
+        `slot` selects the worker (default: the one of this instance).
+        Returns (text, err_lines) or None if the worker is unusable, in which
+        case the caller falls back to running yapf as a separate process.
+        """
+        python_args = self.find_python()
+        if not python_args:
+            self.debug('No python interpreter found for yapf worker')
+            return None
+        if not WORKERS.usable(python_args):
+            self.debug('yapf worker failed before for %s', python_args)
+            return None
+
+        key = self.worker_key(python_args, slot)
+
+        # stop workers once they have been idle for a while
+        WORKERS.reap_later(self.get_setting("worker_idle_timeout", 300))
+
+        self.debug('Running yapf worker %s', python_args)
+        watchdog = self.start_watchdog()
+        try:
+            response = WORKERS.request(
+                key,
+                python_args,
+                self.request_message(text, lines),
+                watchdog=watchdog,
+                env=self.popen_env,
+                startupinfo=self.popen_startupinfo
+            )
+        except Killed as err:
+            return self.killed(err.reason)
+        except (OSError, WorkerError) as err:
+            self.debug('yapf worker failed: %s', err)
+            return None
+        finally:
+            self.stop_watchdog(watchdog)
+        return self.parse_response(response)
+
+    def flight_key(self):
+        """Key of the running invocations in IN_FLIGHT."""
+        return self.view.id()
+
+    def start_watchdog(self, popen=None):
+        """Watch a yapf invocation, see "timeout" and "yapf_cancel"."""
+        watchdog = Watchdog(self.get_setting("timeout", 0) or None)
+        with IN_FLIGHT_LOCK:
+            IN_FLIGHT.setdefault(self.flight_key(), set()).add(watchdog)
+        if popen is not None:
+            watchdog.watch(popen)
+        return watchdog
+
+    def stop_watchdog(self, watchdog):
+        """The invocation is over."""
+        watchdog.done()
+        with IN_FLIGHT_LOCK:
+            watchdogs = IN_FLIGHT.get(self.flight_key(), set())
+            watchdogs.discard(watchdog)
+            if not watchdogs:
+                IN_FLIGHT.pop(self.flight_key(), None)
+
+    def killed(self, reason):
+        """Return (None, err_lines) for an invocation that was killed."""
+        self.kill_reason = reason
+        if reason == 'timeout':
+            msg = 'yapf did not finish within %s seconds' % (
+                self.get_setting("timeout")
+            )
+        else:
+            msg = 'Formatting cancelled'
+        self.debug(msg)
+        return None, [msg]
+
+    def note_speed(self):
+        """Remember whether the file is slow to format, see "on_pre_save"."""
+        seconds = self.timings.stages.get('yapf')
+        fname = self.file_name()
+        if seconds is None or not fname or self.kill_reason == 'cancelled':
+            return
+        limit = self.get_setting("slow_file_seconds", 0)
+        if self.kill_reason == 'timeout' or (limit and seconds > limit):
+            self.debug('%s is slow to format (%.1fs)', fname, seconds)
+            SLOW_FILES.add(fname)
+        else:
+            SLOW_FILES.discard(fname)
+
+    def run_process(self, text, lines=None):
+        """
+        Format text by running yapf in a new process.
+
+        Returns (text, err_lines) or None if yapf could not be run at all.
+        """
+        self.debug('Running %s in %s', self.popen_args, self.popen_cwd)
+        # kill yapf if it takes too long (or is cancelled)
+        watchdog = self.start_watchdog()
+        try:
+            text, err_lines = run_formatter(
+                self.backend,
+                self.popen_args,
+                text,
+                self.encoding,
+                self.style,
+                lines,
+                self.file_name(),
+                cwd=self.popen_cwd,
+                env=self.popen_env,
+                startupinfo=self.popen_startupinfo,
+                watchdog=watchdog
+            )
+        except OSError as err:
+            # always show error in popup
+            msg = "You may need to install %s and/or configure '%s' in PyYapf's Settings." % (
+                self.backend.name, self.backend.command_setting
+            )
+            self.fatal("OSError: %s\n\n%s" % (err, msg))
+            return
+        except UnicodeEncodeError as err:
+            msg = (
+                "You may need to re-open this file with a different encoding."
+                " Current encoding is %r." % self.encoding
+            )
+            self.error("UnicodeEncodeError: %s\n\n%s", err, msg)
+            return
+        except Killed as err:
+            return self.killed(err.reason)
+        finally:
+            self.stop_watchdog(watchdog)
+
+        if err_lines:
+            self.debug('Error:\n%s', '\n'.join(err_lines))
+        return text, err_lines
+
     def debug(self, msg, *args):
         """Logger that will be caught by sublimes ~ output screen."""
         if self.get_setting('debug'):
             print('PyYapf:', msg % args)
 
+    def clear_errors(self):
+        """Forget about previous errors."""
+        self.view.erase_regions(KEY)
+        self.view.erase_status(KEY)
+        self.errors = []
+
     def error(self, msg, *args):
         """Logger to make errors as obvious as we can make them."""
         msg = msg % args
@@ -368,9 +1058,129 @@ class Yapf:
         if self.get_setting('popup_errors'):
             sublime.error_message(msg)
 
+    def fatal(self, msg):
+        """Report an error that will not go away by itself."""
+        sublime.error_message(msg)
+
     def get_setting(self, key, default_value=None):
         """Wrapper to return a single setting."""
-        return get_setting(self.view, key, default_value)
+        return self.settings.get(key, default_value)
+
+
+class YapfFile(Yapf):
+    """
+    This class runs YAPF on a file on disk (see "yapf_project").
+
+    Settings are taken from `view`, errors are collected instead of shown.
+    """
+
+    def __init__(self, view, path, worker_slot=0):
+        """Format `path` with the settings of `view`."""
+        Yapf.__init__(self, view, worker_slot)
+        self.path = path
+        self.fatal_error = None
+
+    def file_name(self):
+        """Name of the file being formatted."""
+        return self.path
+
+    def file_encoding(self):
+        """Files on disk use "default_encoding"."""
+        return None
+
+    def clear_errors(self):
+        """Forget about previous errors."""
+        self.errors = []
+
+    def error(self, msg, *args):
+        """Collect errors."""
+        self.errors.append(msg % args)
+
+    def fatal(self, msg):
+        """Remember that running yapf failed entirely."""
+        self.fatal_error = msg
+
+    def stats_name(self):
+        """Project files only count towards the engine statistics."""
+        return None
+
+    def chunks(self, text):
+        """Project files are already formatted in parallel."""
+        return None
+
+    def format_file(self):
+        """
+        Format the file in place.
+
+        Returns (changed, err_lines) where err_lines is None on success.
+        """
+        try:
+            text, crlf = read_source(self.path, self.encoding)
+        except UnicodeDecodeError as err:
+            return False, ['UnicodeDecodeError: %s' % err]
+
+        result = self.check_syntax(text) or self.run(text)
+        self.note_speed()
+        if result is None:
+            fatal = self.fatal_error or 'yapf could not be run'
+            return False, self.errors or fatal.splitlines()
+        formatted, err_lines = result
+        if err_lines or formatted == text:
+            return False, err_lines
+
+        write_source(self.path, formatted, self.encoding, crlf)
+        return True, None
+
+
+class YapfCheck(Yapf):
+    """
+    This class runs YAPF for "yapf_check".
+
+    Checks run in the background, errors are collected instead of shown.
+    They have workers of their own, to stay out of the way of formatting.
+    """
+
+    worker_group = "check"
+
+    def clear_errors(self):
+        """Forget about previous errors."""
+        self.errors = []
+
+    def error(self, msg, *args):
+        """Collect errors."""
+        self.errors.append(msg % args)
+
+    def fatal(self, msg):
+        """Do not pop up dialogs from the background."""
+        self.debug('%s', msg)
+
+
+class YapfPreFormat(YapfCheck):
+    """
+    This class runs YAPF for "pre_format".
+
+    Speculative formats run "pre_format_jobs" at a time, large documents
+    are not split up on top of that.
+    """
+
+    def chunks(self, text):
+        """Keep to the concurrency limit."""
+        return None
+
+
+class YapfPreview(YapfCheck):
+    """
+    This class runs YAPF for "live_preview".
+
+    Its invocations are killed on their own as soon as the view changes,
+    and they do not wait for the workers of checks.
+    """
+
+    worker_group = "preview"
+
+    def flight_key(self):
+        """Keep apart from the view's other invocations."""
+        return preview_key(self.view.id())
 
 
 def is_python(view):
@@ -387,9 +1197,10 @@ if not SUBLIME_3:
         Sublime Text 2 sucks at this, hence the manual lifting.
         """
 
-        def __init__(self, view):
+        def __init__(self, view, timings=None):
             """Preserve the view (single open document)."""
             self.view = view
+            self.timings = timings
 
         def __enter__(self):
             """Save selection and view."""
@@ -400,6 +1211,7 @@ if not SUBLIME_3:
 
         def __exit__(self, type, value, traceback):
             """Restore selection."""
+            start = clock()
             self.view.sel().clear()
             for s in self.sel:
                 self.view.sel().add(s)
@@ -408,6 +1220,8 @@ if not SUBLIME_3:
             # single statement does not suffice)
             self.view.show(self.visible_region_begin)
             self.view.set_viewport_position(self.viewport_position)
+            if self.timings is not None:
+                self.timings.add('restore', clock() - start)
 else:
 
     class PreserveSelectionAndView:
@@ -417,9 +1231,10 @@ else:
         Sublime Text 3 already does a good job preserving the view.
         """
 
-        def __init__(self, view):
+        def __init__(self, view, timings=None):
             """Preserve view."""
             self.view = view
+            self.timings = timings
 
         def __enter__(self):
             """Save selection."""
@@ -428,9 +1243,12 @@ else:
 
         def __exit__(self, type, value, traceback):
             """Restore selection."""
+            start = clock()
             self.view.sel().clear()
             for s in self.sel:
                 self.view.sel().add(s)
+            if self.timings is not None:
+                self.timings.add('restore', clock() - start)
 
 
 class YapfSelectionCommand(sublime_plugin.TextCommand):
@@ -461,18 +1279,58 @@ class YapfSelectionCommand(sublime_plugin.TextCommand):
                     return
 
                 # format entire document
-                with PreserveSelectionAndView(self.view):
+                with PreserveSelectionAndView(self.view, yapf.timings) as pv:
                     yapf.format(edit)
+                    pv.sel = [yapf.map_region(s) for s in pv.sel]
+                return
+
+            # several selections are formatted with a single yapf run
+            selections = [s for s in self.view.sel() if not s.empty()]
+            if len(selections) > 1 and self.format_batch(edit, yapf, selections):
                 return
 
             # otherwise format all (non-empty) ones
-            with PreserveSelectionAndView(self.view) as pv:
+            with PreserveSelectionAndView(self.view, yapf.timings) as pv:
                 pv.sel = []
                 for s in self.view.sel():
                     if not s.empty():
                         new_s = yapf.format(edit, s)
                         pv.sel.append(new_s if new_s else s)
 
+    def format_batch(self, edit, yapf, selections):
+        """
+        Format the lines of all selections in one go.
+
+        This runs yapf once on the entire document restricted to the
+        selected lines.  Returns False if that did not work (usually because
+        there is a syntax error outside of the selections) or the formatter
+        only takes a single range of lines, in which case the selections
+        have to be formatted one by one.
+        """
+        lines = []
+        for s in selections:
+            lines.append((
+                self.view.rowcol(s.begin())[0] + 1,
+                self.view.rowcol(s.end() - 1)[0] + 1
+            ))
+        lines = merge_ranges(lines)
+        if len(lines) > 1 and not yapf.backend.line_ranges:
+            # the lines in between would be formatted too
+            yapf.debug('%s formats a single range', yapf.backend.name)
+            return False
+
+        document = sublime.Region(0, self.view.size())
+        text = dedent_text(self.view.substr(document))[0]
+        result = yapf.preflight(text, document) or yapf.run(text, lines)
+        if result is None or result[1]:
+            yapf.debug('Formatting selections at once failed')
+            return False
+
+        with PreserveSelectionAndView(self.view, yapf.timings) as pv:
+            yapf.format(edit, result=result, lines=lines)
+            pv.sel = [yapf.map_region(s) for s in pv.sel]
+        return True
+
 
 class YapfDocumentCommand(sublime_plugin.TextCommand):
     """The "yapf_document" command formats the current document."""
@@ -488,37 +1346,910 @@ class YapfDocumentCommand(sublime_plugin.TextCommand):
 
     def run(self, edit):
         """Sublime Text executes this when you trigger the TextCommand."""
-        with PreserveSelectionAndView(self.view):
-            with Yapf(self.view) as yapf:
+        with Yapf(self.view) as yapf:
+            with PreserveSelectionAndView(self.view, yapf.timings) as pv:
                 yapf.format(edit)
+                pv.sel = [yapf.map_region(s) for s in pv.sel]
+
+
+class YapfModifiedLinesCommand(sublime_plugin.TextCommand):
+    """
+    The "yapf_modified_lines" command formats only modified lines.
+
+    These are the lines edited since the document was last formatted as a
+    whole (or since it was opened).
+    """
+
+    def is_enabled(self):
+        """Only allow yapf for python documents."""
+        return is_python(self.view)
+
+    def run(self, edit):
+        """Sublime Text executes this when you trigger the TextCommand."""
+        lines = modified_lines(self.view)
+        if not lines:
+            return
+        with Yapf(self.view) as yapf:
+            with PreserveSelectionAndView(self.view, yapf.timings) as pv:
+                yapf.format(edit, lines=lines)
+                pv.sel = [yapf.map_region(s) for s in pv.sel]
+
+
+def modified_lines(view):
+    """List the (1-based, inclusive) line ranges modified in a view."""
+    ranges = []
+    for region in view.get_regions(DIRTY_KEY):
+        end = max(region.begin(), region.end() - 1)
+        ranges.append(
+            (view.rowcol(region.begin())[0] + 1, view.rowcol(end)[0] + 1)
+        )
+    return merge_ranges(ranges)
+
+
+def forget_modified_lines(view, lines=None):
+    """Forget that `lines` (default: all lines) were modified."""
+    if lines is None:
+        view.erase_regions(DIRTY_KEY)
+        return
+    set_modified_lines(view, subtract_ranges(modified_lines(view), lines))
+
+
+def set_modified_lines(view, ranges):
+    """Mark exactly these (1-based, inclusive) line ranges as modified."""
+    regions = []
+    for start, end in ranges:
+        regions.append(view.full_line(sublime.Region(
+            view.text_point(start - 1, 0), view.text_point(end - 1, 0)
+        )))
+    view.add_regions(DIRTY_KEY, regions, '', '', sublime.HIDDEN)
+
+
+def track_modified_lines(view):
+    """
+    Mark the lines around the cursors as modified.
+
+    The marks are kept as (hidden) regions so that Sublime moves them along
+    when lines are inserted or deleted above them.  This is a guess which
+    misses e.g. "Replace All", undo and edits made by other plugins, where
+    possible ModifiedLinesListener marks exactly what changed instead.
+    """
+    rows = view.rowcol(view.size())[0]
+    added = max(0, rows - LINE_COUNTS.get(view.id(), rows))
+    LINE_COUNTS[view.id()] = rows
+
+    # our own edits do not count
+    if view.change_count() == FORMATTED.get(view.id()):
+        return
+
+    ranges = modified_lines(view)
+    for region in view.sel():
+        first = view.rowcol(region.begin())[0] + 1
+        last = view.rowcol(region.end())[0] + 1
+        # a paste leaves the cursor below the lines it inserted
+        ranges.append((max(1, first - added), last))
+    set_modified_lines(view, merge_ranges(ranges))
+
+
+def mark_text_changes(view, changes):
+    """Mark the lines touched by (begin, end, text) changes as modified."""
+    # our own edits do not count
+    if view.change_count() == FORMATTED.get(view.id()):
+        return
+
+    ranges = modified_lines(view)
+    size = view.size()
+    for begin, end in changed_regions(changes):
+        begin = min(begin, size)
+        end = min(max(begin, end - 1), size)
+        ranges.append(
+            (view.rowcol(begin)[0] + 1, view.rowcol(end)[0] + 1)
+        )
+    set_modified_lines(view, merge_ranges(ranges))
+
+
+# sublime text 4050+ reports exactly what changed
+TEXT_CHANGE_EVENTS = hasattr(sublime_plugin, 'TextChangeListener')
+
+if TEXT_CHANGE_EVENTS:
+
+    class ModifiedLinesListener(sublime_plugin.TextChangeListener):
+        """Remember which lines were edited (see "yapf_modified_lines")."""
+
+        @classmethod
+        def is_applicable(cls, buffer):
+            """Any buffer, it may become python later."""
+            return True
+
+        def on_text_changed(self, changes):
+            """Mark the lines of every change, however it was made."""
+            view = self.buffer.primary_view()
+            if view is not None and is_python(view):
+                mark_text_changes(
+                    view, [(c.a.pt, c.b.pt, c.str) for c in changes]
+                )
+
+
+class YapfApplyCommand(sublime_plugin.TextCommand):
+    """
+    The "yapf_apply" command applies the result of a background job.
+
+    This is used internally, it is a command because edits need one.
+    """
+
+    def run(self, edit):
+        """Replace the document with the formatted text, if any."""
+        result = ASYNC_RESULTS.pop(self.view.id(), None)
+        if result is None:
+            return
+        with Yapf(self.view) as yapf:
+            with PreserveSelectionAndView(self.view, yapf.timings) as pv:
+                yapf.format(edit, result=result)
+                pv.sel = [yapf.map_region(s) for s in pv.sel]
+
+
+def format_in_background(view, lines=None):
+    """
+    Format the entire document (or just `lines`) without blocking the UI.
+
+    The result is applied (and the file saved again) only if the buffer did
+    not change in the meantime.  Repeated calls for a view coalesce while
+    its job is waiting.
+    """
+    text = view.substr(sublime.Region(0, view.size()))
+    JOBS.submit(
+        view.id(), _format_job, view, text, view.change_count(), lines
+    )
+
+
+def pre_format(view, priority=0):
+    """
+    Format a view in the background in case it is saved soon.
+
+    The result is kept along with the change_count it was computed for,
+    "on_pre_save" applies it without running yapf if the view did not
+    change in the meantime.  Waiting views with a higher `priority` are
+    formatted first.
+    """
+    if not is_python(view) or view.is_loading():
+        return
+    settings = view_settings(view)
+    if not (settings.get("pre_format") and settings.get("on_save")):
+        return
+    if settings.get("on_save_mode") == "modified_lines":
+        return
+    action = settings.save_policy().action(
+        view.file_name(), view.size(), view.rowcol(view.size())[0] + 1
+    )
+    if action not in ("format", "background"):
+        return
+
+    change_count = view.change_count()
+    entry = PRE_FORMATTED.get(view.id())
+    if entry is not None and entry[0] == change_count:
+        return
+
+    # one worker slot per thread, apart from the slots used interactively
+    jobs = max(1, settings.get("pre_format_jobs", 1))
+    PRE_FORMATS.workers = jobs
+    text = view.substr(sublime.Region(0, view.size()))
+    PRE_FORMATS.submit(
+        view.id(), _pre_format_job, view, text, change_count,
+        -1 - view.id() % jobs, priority=priority
+    )
+
+
+def _pre_format_job(view, text, change_count, worker_slot):
+    """Format a snapshot of the document and keep the result."""
+    if not view.is_valid() or view.change_count() != change_count:
+        return
+    with YapfPreFormat(view, worker_slot) as yapf:
+        text = dedent_text(text)[0]
+        result = yapf.check_syntax(text) or yapf.run(text)
+        yapf.note_speed()
+        style = (yapf.style, yapf.style_mtime)
+    if result is not None and not result[1]:
+        PRE_FORMATTED[view.id()] = (change_count, style, result)
+
+
+def apply_pre_format(view):
+    """
+    Apply the result of pre_format, if it is still valid.
+
+    Returns False if there is none (the view changed since, or the style).
+    """
+    entry = PRE_FORMATTED.pop(view.id(), None)
+    if entry is None or entry[0] != view.change_count():
+        return False
+    _, style, result = entry
+    with Yapf(view) as yapf:
+        if (yapf.style, yapf.style_mtime) != style:
+            yapf.debug('Style changed since the document was pre-formatted')
+            return False
+        yapf.debug('Using pre-formatted document')
+    ASYNC_RESULTS[view.id()] = result
+    view.run_command('yapf_apply')
+    return True
+
+
+def _format_job(view, text, change_count, lines, worker_slot=0, save=True):
+    """Run yapf on a snapshot of the document (in a background thread)."""
+    with Yapf(view, worker_slot) as yapf:
+        text = dedent_text(text)[0]
+        result = yapf.check_syntax(text) or yapf.run(text, lines)
+        if lines is None:
+            yapf.note_speed()
+    sublime.set_timeout(
+        lambda: _apply_job(view, change_count, result, save), 0
+    )
+
+
+def _apply_job(view, change_count, result, save=True):
+    """Apply the result of _format_job (in the main thread)."""
+    if result is None or not view.is_valid():
+        return
+    if view.change_count() != change_count:
+        print('PyYapf: Buffer changed while formatting, dropping result')
+        return
+
+    ASYNC_RESULTS[view.id()] = result
+    view.run_command('yapf_apply')
+    if save and view.change_count() != change_count:
+        RESAVING.add(view.id())
+        try:
+            view.run_command('save')
+        finally:
+            RESAVING.discard(view.id())
+
+
+class YapfAllViewsCommand(sublime_plugin.WindowCommand):
+    """
+    The "yapf_all_views" command formats all open python views.
+
+    Snapshots of the views are formatted at the same time by a pool of
+    background threads and applied one by one as they come in.  Views
+    edited in the meantime are left alone.
+    """
+
+    def is_enabled(self):
+        """Need python views."""
+        return any(is_python(view) for view in self.window.views())
+
+    def run(self):
+        """Sublime Text executes this when you trigger the WindowCommand."""
+        views = [view for view in self.window.views() if is_python(view)]
+        queue = collections.deque(
+            (view, view.substr(sublime.Region(0, view.size())),
+             view.change_count()) for view in views
+        )
+        ALL_VIEWS_QUEUES[self.window.id()] = queue
+        sublime.status_message('PyYapf: Formatting %d views' % len(views))
+
+        jobs = get_setting(views[0], "project_jobs")
+        jobs = jobs or multiprocessing.cpu_count()
+        for slot in range(min(jobs, len(views))):
+            thread = threading.Thread(target=_format_views, args=(queue, slot))
+            thread.daemon = True
+            thread.start()
+
+
+def _format_views(queue, slot):
+    """Format view snapshots until there are none left (in a thread)."""
+    while True:
+        try:
+            view, text, change_count = queue.popleft()
+        except IndexError:
+            return
+        _format_job(view, text, change_count, None, slot, save=False)
+
+
+class YapfCheckCommand(sublime_plugin.TextCommand):
+    """
+    The "yapf_check" command marks the lines yapf would change.
+
+    The document is left untouched.  With "check_on_idle" this also runs
+    whenever a view is loaded, activated or left alone after an edit.
+    """
+
+    def is_enabled(self):
+        """Only allow yapf for python documents."""
+        return is_python(self.view)
+
+    def run(self, edit):
+        """Sublime Text executes this when you trigger the TextCommand."""
+        check_in_background(self.view, force=True)
+
+
+def schedule_check(view):
+    """Check a view once it was left alone for "check_delay" ms."""
+    if not is_python(view) or not get_setting(view, "check_on_idle"):
+        return
+    token = CHECK_SCHEDULED.get(view.id(), 0) + 1
+    CHECK_SCHEDULED[view.id()] = token
+
+    def check():
+        if CHECK_SCHEDULED.get(view.id()) == token and view.is_valid():
+            check_in_background(view)
+
+    sublime.set_timeout(check, get_setting(view, "check_delay", 1000))
+
+
+def check_in_background(view, force=False):
+    """Check a view, unless it did not change since the last check."""
+    change_count = view.change_count()
+    if not force and CHECKED.get(view.id()) == change_count:
+        return
+    CHECKED[view.id()] = change_count
+    text = view.substr(sublime.Region(0, view.size()))
+    CHECKS.submit(view.id(), _check_job, view, text, change_count)
+
+
+def _check_job(view, text, change_count):
+    """Find the parts of a document yapf would change (in the background)."""
+    changes = None
+    text, indent = dedent_text(text)[:2]
+    with YapfCheck(view) as yapf:
+        result = None if indent else yapf.check_syntax(text) or yapf.run(text)
+    if result is not None and not result[1]:
+        changes = [(begin, end) for begin, end, _ in hunks(text, result[0])]
+    sublime.set_timeout(lambda: _mark_job(view, change_count, changes), 0)
+
+
+def _mark_job(view, change_count, changes):
+    """Mark the result of _check_job (in the main thread)."""
+    if not view.is_valid() or view.change_count() != change_count:
+        return
+
+    regions = []
+    for begin, end in changes or []:
+        regions.extend(view.lines(sublime.Region(begin, max(begin, end - 1))))
+    view.add_regions(CHECK_KEY, regions, KEY, 'dot', CHECK_FLAGS)
+    if regions:
+        view.set_status(
+            CHECK_KEY, 'PyYapf: %d line(s) need formatting' % len(regions)
+        )
+    else:
+        view.erase_status(CHECK_KEY)
+
+
+def preview_key(view_id):
+    """Key of the live preview of a view in JOBS and IN_FLIGHT."""
+    return ('preview', view_id)
+
+
+class YapfAcceptPreviewCommand(sublime_plugin.TextCommand):
+    """The "yapf_accept_preview" command applies the live preview."""
+
+    def is_enabled(self):
+        """Need a preview."""
+        return self.view.id() in PREVIEWS
+
+    def run(self, edit):
+        """Sublime Text executes this when you trigger the TextCommand."""
+        preview = PREVIEWS.pop(self.view.id(), None)
+        if preview is None:
+            return
+        change_count, region, result = preview
+        if self.view.change_count() != change_count:
+            sublime.status_message('PyYapf: The preview is out of date')
+            return
+
+        with Yapf(self.view) as yapf:
+            with PreserveSelectionAndView(self.view, yapf.timings) as pv:
+                yapf.format(edit, sublime.Region(*region), result=result)
+                pv.sel = [yapf.map_region(s) for s in pv.sel]
+        hide_panel(self.view.window(), PREVIEW_PANEL)
+
+
+def schedule_preview(view):
+    """
+    Preview formatting once a view was left alone for "live_preview_delay".
+
+    Whatever was previewed (or is being previewed) for the view is out of
+    date, so a waiting preview job is dropped and a running one killed.
+    """
+    if not is_python(view) or not get_setting(view, "live_preview"):
+        return
+    key = preview_key(view.id())
+    JOBS.cancel(key)
+    cancel_in_flight(key)
+    PREVIEWS.pop(view.id(), None)
+
+    token = PREVIEW_SCHEDULED.get(view.id(), 0) + 1
+    PREVIEW_SCHEDULED[view.id()] = token
+
+    def preview():
+        if PREVIEW_SCHEDULED.get(view.id()) == token and view.is_valid():
+            preview_in_background(view)
+
+    sublime.set_timeout(preview, get_setting(view, "live_preview_delay", 500))
+
+
+def preview_in_background(view):
+    """Format the selection or the top-level block at the caret."""
+    selections = [s for s in view.sel() if not s.empty()]
+    if selections:
+        region, line = (selections[0].begin(), selections[0].end()), None
+    else:
+        caret = view.sel()[0].b if len(view.sel()) else 0
+        region, line = None, view.rowcol(caret)[0]
+    text = view.substr(sublime.Region(0, view.size()))
+    JOBS.submit(
+        preview_key(view.id()), _preview_job, view, text, view.change_count(),
+        region, line
+    )
+
+
+def _preview_job(view, text, change_count, region, line):
+    """Format part of a document without applying it (in the background)."""
+    result = diff = None
+    if region is None:
+        block = top_level_block(text, line)
+        if block is not None:
+            lines = text.splitlines(True)
+            begin = len(''.join(lines[:block[0]]))
+            end = begin + len(''.join(lines[block[0]:block[1]]))
+            region = (begin, end)
+
+    if region is not None:
+        original = text[region[0]:region[1]]
+        source, indent, trailing_nl = dedent_text(original)
+        with YapfPreview(view) as yapf:
+            result = yapf.check_syntax(source) or yapf.run(source)
+        if result is not None and not result[1]:
+            formatted = indent_text(result[0], indent, trailing_nl)
+            if formatted != original:
+                name = os.path.basename(view.file_name() or 'untitled')
+                first_line = text.count('\n', 0, region[0]) + 1
+                diff = unified_diff(original, formatted, name, first_line)
+
+    sublime.set_timeout(
+        lambda: _show_preview(view, change_count, region, result, diff), 0
+    )
+
+
+def _show_preview(view, change_count, region, result, diff):
+    """Show the result of _preview_job (in the main thread)."""
+    if not view.is_valid() or view.change_count() != change_count:
+        return
+    window = view.window()
+    if diff is None:
+        PREVIEWS.pop(view.id(), None)
+        hide_panel(window, PREVIEW_PANEL)
+        return
+
+    PREVIEWS[view.id()] = (change_count, region, result)
+    if window is not None and window.active_view() == view:
+        show_panel(window, diff, PREVIEW_PANEL, DIFF_SYNTAX)
+
+
+class YapfProjectCommand(sublime_plugin.WindowCommand):
+    """
+    The "yapf_project" command formats all python files of the project.
+
+    Files are formatted in place by a pool of background threads, each
+    running its own yapf.  Run it with {"cancel": true} to stop it.
+    """
+
+    def is_enabled(self, cancel=False):
+        """Need project folders (and a view to take settings from)."""
+        if cancel:
+            return self.window.id() in PROJECT_RUNS
+        return bool(self.window.folders()) and bool(self.window.active_view())
+
+    def run(self, cancel=False):
+        """Sublime Text executes this when you trigger the WindowCommand."""
+        run = PROJECT_RUNS.get(self.window.id())
+        if cancel:
+            if run is not None:
+                run.cancelled = True
+                cancel_in_flight(run.view.id())
+            return
+        if run is not None:
+            sublime.status_message('PyYapf: Already formatting this project')
+            return
+
+        run = ProjectFormat(self.window, self.window.active_view())
+        PROJECT_RUNS[self.window.id()] = run
+        thread = threading.Thread(target=run.run)
+        thread.daemon = True
+        thread.start()
+
+
+class ProjectFormat:
+    """A running "yapf_project" command."""
+
+    def __init__(self, window, view):
+        """Capture everything needed from the main thread."""
+        self.window = window
+        self.view = view
+        self.settings = view_settings(view)
+        self.folders = window.folders()
+
+        # files with unsaved changes are left alone
+        self.skip = set(
+            v.file_name() for v in window.views()
+            if v.file_name() and v.is_dirty()
+        )
+
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.total = 0
+        self.changed = []
+        self.unchanged = []
+        self.skipped = []
+        # (path, err_lines)
+        self.failed = []
+
+    def run(self):
+        """Find and format the files (in a background thread)."""
+        start = time.time()
+        try:
+            paths = list(find_python_files(
+                self.folders,
+                self.settings.get("onsave_ignore_fn_glob", []),
+                lambda: self.cancelled
+            ))
+            self.total = len(paths)
+            queue = collections.deque(paths)
+
+            jobs = self.settings.get("project_jobs") or multiprocessing.cpu_count()
+            threads = []
+            for slot in range(min(jobs, len(paths))):
+                thread = threading.Thread(target=self.work, args=(queue, slot))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        finally:
+            elapsed = time.time() - start
+            sublime.set_timeout(lambda: self.finish(elapsed), 0)
+
+    def work(self, queue, slot):
+        """Format files until there are none left."""
+        while not self.cancelled:
+            try:
+                path = queue.popleft()
+            except IndexError:
+                return
+
+            if path in self.skip:
+                self.record(self.skipped, path)
+                continue
+
+            with YapfFile(self.view, path, slot) as yapf:
+                try:
+                    changed, err_lines = yapf.format_file()
+                except (IOError, OSError) as err:
+                    changed, err_lines = False, [str(err)]
+            if yapf.fatal_error:
+                # no point in trying the other files
+                self.cancelled = True
+
+            if err_lines:
+                self.record(self.failed, (path, err_lines))
+            elif changed:
+                self.record(self.changed, path)
+            else:
+                self.record(self.unchanged, path)
+
+    def record(self, outcome, item):
+        """Count a file and update the progress in the status bar."""
+        with self.lock:
+            outcome.append(item)
+            done = (
+                len(self.changed) + len(self.unchanged) +
+                len(self.skipped) + len(self.failed)
+            )
+        msg = 'PyYapf: Formatting project %d/%d' % (done, self.total)
+        sublime.set_timeout(lambda: self.view.set_status(PROGRESS_KEY, msg), 0)
+
+    def finish(self, elapsed):
+        """Show a summary (in the main thread)."""
+        PROJECT_RUNS.pop(self.window.id(), None)
+        self.view.erase_status(PROGRESS_KEY)
+
+        lines = [
+            'PyYapf: %s %d files in %.1fs: %d changed, %d unchanged, '
+            '%d skipped, %d failed' % (
+                'Cancelled after' if self.cancelled else 'Formatted',
+                self.total, elapsed, len(self.changed), len(self.unchanged),
+                len(self.skipped), len(self.failed)
+            )
+        ]
+        for title, paths in (
+            ('Changed', self.changed), ('Skipped (unsaved changes)', self.skipped)
+        ):
+            if paths:
+                lines += ['', '%s:' % title]
+                lines += ['  %s' % path for path in sorted(paths)]
+        if self.failed:
+            backend = get_backend(self.settings.get("formatter"))
+            backend = backend or get_backend(None)
+            lines += ['', 'Failed:']
+            for path, err_lines in sorted(self.failed):
+                line = backend.error_position(err_lines)[0] or 0
+                lines.append('  %s:%d: %s' % (path, line, err_lines[-1]))
+        show_panel(self.window, '\n'.join(lines) + '\n')
+
+
+class YapfCancelCommand(sublime_plugin.WindowCommand):
+    """
+    The "yapf_cancel" command stops all formatting in the window.
+
+    Running yapf processes are killed, waiting background formats dropped
+    and "yapf_project" and "yapf_all_views" are stopped.
+    """
+
+    def run(self):
+        """Sublime Text executes this when you trigger the WindowCommand."""
+        view_ids = [view.id() for view in self.window.views()]
+        queue = ALL_VIEWS_QUEUES.pop(self.window.id(), None)
+        if queue is not None:
+            queue.clear()
+        run = PROJECT_RUNS.get(self.window.id())
+        if run is not None:
+            run.cancelled = True
+            view_ids.append(run.view.id())
+        for view_id in view_ids:
+            JOBS.cancel(view_id)
+            PRE_FORMATS.cancel(view_id)
+            CHECKS.cancel(view_id)
+            cancel_in_flight(view_id)
+            JOBS.cancel(preview_key(view_id))
+            cancel_in_flight(preview_key(view_id))
+
+
+def cancel_in_flight(key):
+    """Kill the yapf invocations running for a view (or its preview)."""
+    with IN_FLIGHT_LOCK:
+        watchdogs = list(IN_FLIGHT.get(key, ()))
+    for watchdog in watchdogs:
+        watchdog.cancel()
+
+
+def show_panel(window, text, name=KEY, syntax=None):
+    """Show `text` in one of PyYapf's output panels."""
+    if hasattr(window, 'create_output_panel'):
+        panel = window.create_output_panel(name)
+    else:
+        panel = window.get_output_panel(name)
+    if syntax is not None:
+        panel.set_syntax_file(syntax)
+    panel.run_command('append', {'characters': text})
+    window.run_command('show_panel', {'panel': 'output.%s' % name})
+
+
+def hide_panel(window, name=KEY):
+    """Hide one of PyYapf's output panels (if it is showing)."""
+    if window is not None:
+        window.run_command('hide_panel', {'panel': 'output.%s' % name})
+
+
+class YapfStatsCommand(sublime_plugin.WindowCommand):
+    """
+    The "yapf_stats" command shows how long formatting takes.
+
+    Lists the median, 95th percentile and maximum time of every stage over
+    the last formats, per engine and per view.
+    """
+
+    def run(self):
+        """Sublime Text executes this when you trigger the WindowCommand."""
+        summary = STATS.summary()
+        if not summary:
+            sublime.status_message('PyYapf: Nothing formatted yet')
+            return
+
+        lines = ['PyYapf latency (ms, last %d formats)' % STATS.window]
+        for scope, stages in summary.items():
+            lines.append('')
+            lines.append(scope)
+            lines.append(
+                '  %-10s %6s %9s %9s %9s' % ('stage', 'count', 'p50', 'p95',
+                                             'max')
+            )
+            for stage, count, p50, p95, maximum in stages:
+                lines.append(
+                    '  %-10s %6d %9.1f %9.1f %9.1f' %
+                    (stage, count, 1000 * p50, 1000 * p95, 1000 * maximum)
+                )
+        show_panel(self.window, '\n'.join(lines) + '\n')
 
 
 class EventListener(sublime_plugin.EventListener):
-    """Hook in to detect when a file is saved."""
+    """Hook in to detect when a file is saved (or modified)."""
+
+    def on_modified(self, view):  # pylint: disable=no-self-use
+        """Remember which lines were edited (see "yapf_modified_lines")."""
+        if is_python(view):
+            PRE_FORMATTED.pop(view.id(), None)
+            if not TEXT_CHANGE_EVENTS:
+                track_modified_lines(view)
+            schedule_check(view)
+            if not SUBLIME_3:
+                schedule_preview(view)
+
+    def on_modified_async(self, view):  # pylint: disable=no-self-use
+        """Preview formatting while typing (see "live_preview")."""
+        schedule_preview(view)
+
+    def on_load(self, view):  # pylint: disable=no-self-use
+        """Check new views (see "check_on_idle")."""
+        schedule_check(view)
+        if not SUBLIME_3:
+            pre_format(view)
+
+    def on_activated(self, view):  # pylint: disable=no-self-use
+        """Check views when they come to the front (see "check_on_idle")."""
+        schedule_check(view)
+        if not SUBLIME_3:
+            pre_format(view, time.time())
+
+    def on_load_async(self, view):  # pylint: disable=no-self-use
+        """Format new views ahead of saving (see "pre_format")."""
+        pre_format(view)
+
+    def on_activated_async(self, view):  # pylint: disable=no-self-use
+        """Format the view in front first (see "pre_format")."""
+        pre_format(view, time.time())
+
+    def on_close(self, view):  # pylint: disable=no-self-use
+        """Forget about closed views."""
+        LINE_COUNTS.pop(view.id(), None)
+        FORMATTED.pop(view.id(), None)
+        PREFLIGHT.pop(view.id(), None)
+        CHECKED.pop(view.id(), None)
+        CHECK_SCHEDULED.pop(view.id(), None)
+        PREVIEWS.pop(view.id(), None)
+        PREVIEW_SCHEDULED.pop(view.id(), None)
+        PRE_FORMATS.cancel(view.id())
+        CHECKS.cancel(view.id())
+        PRE_FORMATTED.pop(view.id(), None)
+        SETTINGS.pop(view.id(), None)
+        view.settings().clear_on_change(KEY)
 
     def on_pre_save(self, view):  # pylint: disable=no-self-use
         """Before we let ST save the file, run yapf on it."""
-        if get_setting(view, 'on_save'):
-            if view.file_name() and get_setting(view, "onsave_ignore_fn_glob"):
-                for pattern in get_setting(view, "onsave_ignore_fn_glob"):
-                    if fnmatch.fnmatch(view.file_name(), pattern):
-                        print(
-                            'PyYapf: Skipping yapf, matches pattern {}'.
-                            format(pattern)
-                        )
-                        return
+        if view.id() in RESAVING:
+            # saving the result of format_in_background
+            return
 
-            view.run_command('yapf_document')
+        settings = view_settings(view)
+        if settings.get('on_save'):
+            action = settings.save_policy().action(
+                view.file_name(),
+                view.size(),
+                view.rowcol(view.size())[0] + 1
+            )
+            if action == 'exclude':
+                print('PyYapf: Skipping yapf, file name is excluded')
+                return
+            if action == 'skip':
+                sublime.status_message(
+                    'PyYapf: Skipping yapf, file is too large'
+                )
+                return
 
+            in_background = (
+                settings.get('on_save_async') or action == 'background'
+            )
+            if view.file_name() in SLOW_FILES:
+                policy = settings.get('slow_files_on_save', 'background')
+                if policy == 'skip':
+                    sublime.status_message(
+                        'PyYapf: Skipping yapf, file is slow to format'
+                    )
+                    return
+                in_background = in_background or policy == 'background'
 
-def get_setting(view, key, default_value=None):
-    """Retrieve a key from the settings file."""
-    # 1. check sublime settings (this includes project settings)
-    settings = sublime.active_window().active_view().settings()
-    config = settings.get(SUBLIME_SETTINGS_KEY)
-    if config is not None and key in config:
-        return config[key]
-
-    # 2. check plugin settings
+            mode = settings.get('on_save_mode')
+            if action == 'modified_lines' or mode == 'modified_lines':
+                lines = modified_lines(view)
+                if not lines:
+                    return
+                if in_background:
+                    format_in_background(view, lines)
+                else:
+                    view.run_command('yapf_modified_lines')
+            elif apply_pre_format(view):
+                # formatted ahead of time, see "pre_format"
+                pass
+            elif in_background:
+                format_in_background(view)
+            else:
+                view.run_command('yapf_document')
+
+
+def settings_changed():
+    """Drop everything derived from the plugin settings."""
+    SETTINGS.clear()
+    PROFILES.clear()
+    POLICIES.clear()
+    PRE_FORMATTED.clear()
+    WORKERS.forget_failures()
+
+
+def plugin_loaded():
+    """Watch the plugin settings for changes."""
     settings = sublime.load_settings(PLUGIN_SETTINGS_FILE)
-    return settings.get(key, default_value)
+    settings.add_on_change(KEY, settings_changed)
+
+
+def plugin_unloaded():
+    """Stop background jobs and yapf workers when the plugin is unloaded."""
+    sublime.load_settings(PLUGIN_SETTINGS_FILE).clear_on_change(KEY)
+    JOBS.shutdown()
+    PRE_FORMATS.shutdown()
+    CHECKS.shutdown()
+    WORKERS.shutdown()
+
+
+class ViewSettings:
+    """
+    PyYapf settings of a single view.
+
+    Project settings (the "PyYapf" key of the view's settings) override the
+    plugin settings.  Lookups are memoized until either of them changes.
+    """
+
+    def __init__(self, view):
+        """Start out with nothing resolved."""
+        self.view_settings = view.settings()
+        self.values = {}
+        self.policy = None
+
+    def get(self, key, default_value=None):
+        """Retrieve a key from the settings."""
+        try:
+            value = self.values[key]
+        except KeyError:
+            # 1. check sublime settings (this includes project settings)
+            config = self.view_settings.get(SUBLIME_SETTINGS_KEY)
+            if config is not None and key in config:
+                value = config[key]
+            else:
+                # 2. check plugin settings
+                settings = sublime.load_settings(PLUGIN_SETTINGS_FILE)
+                value = settings.get(key)
+            self.values[key] = value
+        return default_value if value is None else value
+
+    def save_policy(self):
+        """Return the (shared) SavePolicy for these settings."""
+        if self.policy is None:
+            options = (
+                tuple(self.get('onsave_include_fn_glob', [])),
+                tuple(self.get('onsave_ignore_fn_glob', [])),
+                self.get('on_save_max_lines', 0),
+                self.get('on_save_max_size', 0),
+                self.get('on_save_large_files', 'skip')
+            )
+            self.policy = POLICIES.get(options)
+            if self.policy is None:
+                self.policy = POLICIES[options] = SavePolicy(*options)
+        return self.policy
+
+
+def view_settings(view):
+    """Return the (cached) ViewSettings of a view."""
+    settings = SETTINGS.get(view.id())
+    if settings is None:
+        settings = SETTINGS[view.id()] = ViewSettings(view)
+        view_id = view.id()
+        # the callback of an earlier memo may still be registered
+        settings.view_settings.clear_on_change(KEY)
+        settings.view_settings.add_on_change(
+            KEY, lambda: SETTINGS.pop(view_id, None)
+        )
+    return settings
+
+
+def get_setting(view, key, default_value=None):
+    """Retrieve a key from the settings of `view`."""
+    return view_settings(view).get(key, default_value)
+
+
+# sublime text 2 does not call plugin_loaded
+if not SUBLIME_3:
+    plugin_loaded()
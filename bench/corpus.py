@@ -0,0 +1,102 @@
+"""
+Generate (badly formatted) python source for benchmarking.
+
+The output is deterministic for a given size and seed.  It mixes functions
+and classes indented by two and four spaces, long calls and literals that
+yapf has to split, and comments with non-ASCII (but Latin-1 encodable)
+characters so that the same corpus can be stored in different encodings.
+"""
+import random
+
+WORDS = [
+    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta',
+    'iota', 'kappa', 'lambda_', 'mu', 'nu', 'xi', 'omicron', 'pi', 'rho'
+]
+
+COMMENTS = [
+    u'# résumé of the naïve approach',
+    u'# grüße, this is café code',
+    u'# TODO: clean this up',
+    u'# plain ascii comment',
+]
+
+
+def _name(rng):
+    return '%s_%s' % (rng.choice(WORDS), rng.choice(WORDS))
+
+
+def _statement(rng):
+    kind = rng.randint(0, 5)
+    if kind == 0:
+        return '%s=%s( %s,%s )' % (
+            _name(rng), _name(rng), rng.randint(0, 99), _name(rng)
+        )
+    if kind == 1:
+        items = ','.join(
+            "'%s':%d" % (rng.choice(WORDS), rng.randint(0, 999))
+            for _ in range(rng.randint(2, 12))
+        )
+        return '%s = {%s}' % (_name(rng), items)
+    if kind == 2:
+        args = ' , '.join(_name(rng) for _ in range(rng.randint(3, 10)))
+        return 'result = %s(%s)' % (_name(rng), args)
+    if kind == 3:
+        return rng.choice(COMMENTS)
+    if kind == 4:
+        return 'if %s>%d :  %s+=1' % (_name(rng), rng.randint(0, 9), _name(rng))
+    return 'return  %s' % _name(rng)
+
+
+def _block(rng, indent, depth, budget):
+    """A def (or class with methods) of at most `budget` lines."""
+    lines = []
+    prefix = indent * depth
+    if depth == 0 and budget >= 8 and rng.random() < 0.3:
+        lines.append('class %s( object ):' % _name(rng).title().replace('_', ''))
+        while len(lines) < budget - 2:
+            lines.extend(_block(rng, indent, 1, min(budget - len(lines), 12)))
+        return lines
+
+    lines.append('%sdef %s( %s,%s_ ):' % (prefix, _name(rng), _name(rng), _name(rng)))
+    body = max(0, min(budget - 3, rng.randint(2, 10)))
+    for _ in range(body):
+        lines.append(prefix + indent + _statement(rng))
+    lines.append(prefix + indent + 'return  %s' % _name(rng))
+    lines.append('')
+    return lines
+
+
+def generate(lines, seed=0):
+    """Return roughly `lines` lines of python source."""
+    rng = random.Random(seed)
+    out = ['import os,sys', 'import re', '']
+    while len(out) < lines:
+        indent = rng.choice(['  ', '    '])
+        out.extend(_block(rng, indent, 0, max(3, min(lines - len(out), 30))))
+    return '\n'.join(out) + '\n'
+
+
+def indented_blocks(source, count):
+    """
+    Find up to `count` indented blocks (method bodies) to select.
+
+    Returns (begin, end) character offsets covering whole lines.
+    """
+    blocks = []
+    offset = 0
+    start = None
+    for line in source.splitlines(True):
+        indented = line.startswith(' ') and not line.lstrip().startswith('def ')
+        if indented and start is None:
+            start = offset
+        elif not indented and start is not None:
+            blocks.append((start, offset))
+            start = None
+        offset += len(line)
+    if start is not None:
+        blocks.append((start, offset))
+
+    if len(blocks) <= count:
+        return blocks
+    step = len(blocks) / float(count)
+    return [blocks[int(i * step)] for i in range(count)]
@@ -0,0 +1,396 @@
+"""
+Headless PyYapf benchmark.
+
+Runs PyYapf.py against in-memory stand-ins for the `sublime` and
+`sublime_plugin` modules (see stubs/) on a generated corpus and reports how
+long every stage of a format takes.  Needs python 3 and a yapf install:
+
+    python bench/run.py --yapf-command ~/venv/bin/yapf --output results.json
+    python bench/run.py --compare before.json after.json
+
+`--formatters yapf,ruff` runs every combination with each formatter backend
+on the same corpus and ends with a side by side comparison of their totals
+(ruff only runs with the "process" engine).
+
+Stages are timed by wrapping the functions PyYapf calls: dedent_text,
+indent_text, process spawn and communicate (process engine), the worker or
+in-process request (worker / api engines) and View.replace.  Encoding and
+decoding can not be wrapped (they are str/bytes methods) and are timed by
+repeating them on the same text after the format (the process engine
+encodes while communicating, so "communicate" includes encoding).  "memory" is the peak
+python memory allocated in the plugin host, measured in a separate run
+because tracemalloc slows everything down.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'stubs'))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import sublime  # noqa: E402 pylint: disable=wrong-import-position
+import PyYapf  # noqa: E402 pylint: disable=wrong-import-position
+
+import corpus  # noqa: E402 pylint: disable=wrong-import-position
+from pyyapf_core import runner  # noqa: E402 pylint: disable=wrong-import-position
+from pyyapf_core.backends import (  # noqa: E402 pylint: disable=wrong-import-position
+    get_backend
+)
+from pyyapf_core.settings import (  # noqa: E402 pylint: disable=wrong-import-position
+    DEFAULT_SETTINGS, load
+)
+
+SCENARIOS = ('document', 'selection', 'on_save')
+
+
+class Stages(object):
+    """Collects the time spent in every stage of a run."""
+
+    def __init__(self):
+        self.times = collections.OrderedDict()
+        self.dedented = []
+        self.encoded = []
+
+    def add(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def timed(self, stage, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+
+STAGES = Stages()
+
+
+class TimedPopen(subprocess.Popen):
+    """Popen that reports spawn and communicate times."""
+
+    def __init__(self, *args, **kwargs):
+        start = time.perf_counter()
+        super(TimedPopen, self).__init__(*args, **kwargs)
+        STAGES.add('spawn', time.perf_counter() - start)
+
+    def communicate(self, input=None, timeout=None):
+        start = time.perf_counter()
+        try:
+            stdout, stderr = super(TimedPopen, self).communicate(input, timeout)
+        finally:
+            STAGES.add('communicate', time.perf_counter() - start)
+        STAGES.encoded.append(stdout)
+        return stdout, stderr
+
+
+class TimedSubprocess(object):
+    """Replaces the subprocess module as seen by pyyapf_core.runner."""
+
+    Popen = TimedPopen
+
+    def __getattr__(self, name):
+        return getattr(subprocess, name)
+
+
+def timed_communicate(communicate):
+    """Time PyYapf's own communicate (text is encoded into the pipe)."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            stdout, stderr = communicate(*args, **kwargs)
+        finally:
+            STAGES.add('communicate', time.perf_counter() - start)
+        STAGES.encoded.append(stdout)
+        return stdout, stderr
+    return wrapper
+
+
+def instrument():
+    """Wrap the functions PyYapf calls."""
+    dedent_text = PyYapf.dedent_text
+
+    def recording_dedent(text):
+        result = dedent_text(text)
+        STAGES.dedented.append(result[0])
+        return result
+
+    PyYapf.dedent_text = STAGES.timed('dedent_text', recording_dedent)
+    PyYapf.indent_text = STAGES.timed('indent_text', PyYapf.indent_text)
+    # the process engine runs yapf through pyyapf_core.runner
+    runner.subprocess = TimedSubprocess()
+    runner.communicate = timed_communicate(runner.communicate)
+    PyYapf.WORKERS.request = STAGES.timed('worker', PyYapf.WORKERS.request)
+    PyYapf.inprocess.request = STAGES.timed('api', PyYapf.inprocess.request)
+
+
+def make_view(source, encoding, directory):
+    """A view on a (not necessarily existing) file in `directory`."""
+    view = sublime.View(
+        source, file_name=os.path.join(directory, 'bench.py'),
+        encoding=encoding
+    )
+    view.replace = STAGES.timed('replace', view.replace)
+    sublime.active_window().add_view(view)
+    return view
+
+
+def run_case(scenario, source, encoding, selections, directory):
+    """Format once, return the wall time and the (dedented) texts seen."""
+    view = make_view(source, encoding, directory)
+    if scenario == 'selection':
+        for begin, end in corpus.indented_blocks(source, selections):
+            view.sel().add(sublime.Region(begin, end))
+
+    start = time.perf_counter()
+    if scenario == 'document':
+        view.run_command('yapf_document')
+    elif scenario == 'selection':
+        view.run_command('yapf_selection')
+    else:
+        PyYapf.EventListener().on_pre_save(view)
+    elapsed = time.perf_counter() - start
+    sublime.run_timeouts()
+    return elapsed, view
+
+
+def replay_codec(encoding):
+    """Time encoding the input and decoding the output like PyYapf does."""
+    for text in STAGES.dedented:
+        start = time.perf_counter()
+        try:
+            text.encode(encoding)
+        except UnicodeEncodeError:
+            pass
+        STAGES.add('encode', time.perf_counter() - start)
+    for data in STAGES.encoded:
+        start = time.perf_counter()
+        try:
+            data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+        STAGES.add('decode', time.perf_counter() - start)
+
+
+def benchmark(
+    args, settings, formatter, scenario, engine, encoding, lines, directory
+):
+    """Run one combination `args.repeat` times."""
+    source = corpus.generate(lines, seed=lines)
+    settings.set('formatter', formatter)
+    settings.set('engine', engine)
+
+    # warm up (starts workers, imports yapf, ...)
+    run_case(scenario, source, encoding, args.selections, directory)
+
+    totals = []
+    stages = collections.OrderedDict()
+    ok = True
+    for _ in range(args.repeat):
+        STAGES.__init__()
+        elapsed, view = run_case(
+            scenario, source, encoding, args.selections, directory
+        )
+        replay_codec(encoding)
+        ok = ok and not view.get_status(PyYapf.KEY)
+        totals.append(elapsed)
+        for stage, seconds in STAGES.times.items():
+            stages.setdefault(stage, []).append(seconds)
+
+    record = collections.OrderedDict([
+        ('formatter', formatter),
+        ('scenario', scenario),
+        ('engine', engine),
+        ('encoding', encoding),
+        ('lines', lines),
+        ('selections', args.selections if scenario == 'selection' else 0),
+        ('ok', ok),
+        ('total', min(totals)),
+        ('stages', collections.OrderedDict(
+            (stage, min(times)) for stage, times in stages.items()
+        )),
+    ])
+
+    if args.memory:
+        tracemalloc.start()
+        run_case(scenario, source, encoding, args.selections, directory)
+        record['memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return record
+
+
+def print_record(record):
+    """One line per combination."""
+    stages = ' '.join(
+        '%s=%.1f' % (stage, 1000 * seconds)
+        for stage, seconds in record['stages'].items()
+    )
+    memory = record.get('memory')
+    print('%-4s %-9s %-8s %-8s %6d lines %3d sel %8.1f ms %s%s%s' % (
+        record.get('formatter', 'yapf'), record['scenario'], record['engine'],
+        record['encoding'],
+        record['lines'], record['selections'], 1000 * record['total'],
+        '' if memory is None else '%7.1f MB ' % (memory / 1048576.0),
+        '' if record['ok'] else 'FAILED ',
+        stages
+    ))
+
+
+def compare(old_path, new_path):
+    """
+    Print how the totals changed between two result files.
+
+    Combinations that failed on either side (e.g. latin-1 with the process
+    engine, yapf reads stdin as UTF-8) timed error paths, not formats, and
+    are only listed.
+    """
+    def load(path):
+        with open(path) as fp:
+            return collections.OrderedDict(
+                ((r.get('formatter', 'yapf'), r['scenario'], r['engine'],
+                  r['encoding'], r['lines'], r['selections']), r)
+                for r in json.load(fp)
+            )
+
+    old, new = load(old_path), load(new_path)
+    for key, record in new.items():
+        if key not in old:
+            continue
+        if not (old[key]['ok'] and record['ok']):
+            print('%-4s %-9s %-8s %-8s %6d lines %3d sel failed' % key)
+            continue
+        before, after = old[key]['total'], record['total']
+        line = '%-4s %-9s %-8s %-8s %6d lines %3d sel %8.1f -> %8.1f ms (%+.0f%%)' % (
+            key + (1000 * before, 1000 * after, 100 * (after / before - 1))
+        )
+        if 'memory' in old[key] and 'memory' in record:
+            before, after = old[key]['memory'], record['memory']
+            line += '  %7.1f -> %7.1f MB (%+.0f%%)' % (
+                before / 1048576.0, after / 1048576.0,
+                100 * (after / float(before) - 1)
+            )
+        print(line)
+
+
+def compare_formatters(records):
+    """Print the totals of every formatter side by side (if it worked)."""
+    formatters = []
+    totals = collections.OrderedDict()
+    for record in records:
+        if record['formatter'] not in formatters:
+            formatters.append(record['formatter'])
+        if not record['ok']:
+            continue
+        key = (record['scenario'], record['encoding'], record['lines'],
+               record['selections'])
+        best = totals.setdefault(key, {})
+        # the fastest engine of every formatter (that did not fail)
+        total = best.get(record['formatter'])
+        if total is None or record['total'] < total:
+            best[record['formatter']] = record['total']
+
+    print('')
+    print('%-9s %-8s %6s %3s  %s' % (
+        'scenario', 'encoding', 'lines', 'sel',
+        ' '.join('%10s' % name for name in formatters)
+    ))
+    for key, best in totals.items():
+        print('%-9s %-8s %6d %3d  %s' % (key + (' '.join(
+            '%10s' % ('%.1f ms' % (1000 * best[name]) if name in best else '-')
+            for name in formatters
+        ), )))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--yapf-command', help='yapf executable to use')
+    parser.add_argument('--ruff-command', help='ruff executable to use')
+    parser.add_argument(
+        '--formatters', default='yapf', help='formatter backends to compare'
+    )
+    parser.add_argument(
+        '--yapf-site-packages', action='append', default=[],
+        help='site-packages directory for the "api" engine'
+    )
+    parser.add_argument('--engines', default='process,worker,api')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--sizes', default='100,1000,10000,50000')
+    parser.add_argument('--encodings', default='UTF-8,latin-1')
+    parser.add_argument('--selections', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--cache', action='store_true', help='keep the result cache enabled'
+    )
+    parser.add_argument(
+        '--memory', action='store_true', help='measure peak memory'
+    )
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='compare two result files instead of running'
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    settings = sublime.load_settings(PyYapf.PLUGIN_SETTINGS_FILE)
+    for key, value in load(DEFAULT_SETTINGS).items():
+        settings.set(key, value)
+    settings.set('on_save', True)
+    settings.set('yapf_site_packages', args.yapf_site_packages)
+    settings.set('timeout', 0)
+    settings.set('slow_files_on_save', 'format')
+    if args.yapf_command:
+        settings.set('yapf_command', args.yapf_command)
+    if args.ruff_command:
+        settings.set('ruff_command', args.ruff_command)
+    if not args.cache:
+        settings.set('cache_size', 0)
+        settings.set('cache_disk_size', 0)
+    PyYapf.plugin_loaded()
+    instrument()
+
+    records = []
+    directory = tempfile.mkdtemp(prefix='pyyapf-bench-')
+    try:
+        for lines in [int(size) for size in args.sizes.split(',')]:
+            for scenario in args.scenarios.split(','):
+                for formatter in args.formatters.split(','):
+                    for engine in args.engines.split(','):
+                        if engine != 'process' and not get_backend(
+                            formatter
+                        ).api:
+                            continue
+                        for encoding in args.encodings.split(','):
+                            record = benchmark(
+                                args, settings, formatter, scenario, engine,
+                                encoding, lines, directory
+                            )
+                            print_record(record)
+                            records.append(record)
+    finally:
+        PyYapf.plugin_unloaded()
+        os.rmdir(directory)
+
+    if len(args.formatters.split(',')) > 1:
+        compare_formatters(records)
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(records, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
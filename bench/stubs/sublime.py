@@ -0,0 +1,394 @@
+"""
+In-memory stand-in for Sublime Text's `sublime` module.
+
+Just enough of the API for PyYapf to run headlessly (see bench/run.py).
+Timeouts are queued and only run by `run_timeouts()`; regions added with
+`View.add_regions` do not move when the text is edited.
+"""
+import bisect
+import os
+import tempfile
+
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+DRAW_SQUIGGLY_UNDERLINE = 2048
+DRAW_OUTLINED = 256
+DRAW_EMPTY = 1
+HIDDEN = 128
+PERSISTENT = 16
+LAYOUT_BLOCK = 2
+ENCODED_POSITION = 1
+
+_timeouts = []
+_settings = {}
+_windows = []
+messages = []
+
+
+def version():
+    return '4000'
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return '(%d, %d)' % (self.a, self.b)
+
+    def __len__(self):
+        return self.size()
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+        for cb in list(self.callbacks.values()):
+            cb()
+
+    def has(self, key):
+        return key in self.values
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+
+class Selection(object):
+    def __init__(self):
+        self.regions = []
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, region):
+        self.regions.append(region)
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, i):
+        return self.regions[i]
+
+
+class Edit(object):
+    pass
+
+
+_view_ids = [0]
+
+
+class View(object):
+    def __init__(self, text='', file_name=None, encoding='UTF-8', window=None,
+                 syntax='source.python'):
+        _view_ids[0] += 1
+        self.view_id = _view_ids[0]
+        self.text = text
+        self._file_name = file_name
+        self._encoding = encoding
+        self._settings = Settings()
+        self._sel = Selection()
+        self._window = window
+        self._regions = {}
+        self._status = {}
+        self._change_count = 0
+        self.syntax = syntax
+        self.commands = []
+        self.replacements = 0
+        self._line_starts = None
+
+    def id(self):
+        return self.view_id
+
+    def buffer_id(self):
+        return self.view_id
+
+    def is_valid(self):
+        return True
+
+    def is_loading(self):
+        return False
+
+    def is_dirty(self):
+        return self._change_count > 0
+
+    def window(self):
+        return self._window
+
+    def settings(self):
+        return self._settings
+
+    def file_name(self):
+        return self._file_name
+
+    def encoding(self):
+        return self._encoding
+
+    def size(self):
+        return len(self.text)
+
+    def change_count(self):
+        return self._change_count
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self.text[x.begin():x.end()]
+        return self.text[x:x + 1]
+
+    def _edited(self):
+        self._change_count += 1
+        self._line_starts = None
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+        self.replacements += 1
+        self._edited()
+
+    def insert(self, edit, point, text):
+        self.text = self.text[:point] + text + self.text[point:]
+        self._edited()
+        return len(text)
+
+    def erase(self, edit, region):
+        self.replace(edit, region, '')
+
+    def sel(self):
+        return self._sel
+
+    def _starts(self):
+        if self._line_starts is None:
+            starts = [0]
+            pos = self.text.find('\n')
+            while pos != -1:
+                starts.append(pos + 1)
+                pos = self.text.find('\n', pos + 1)
+            self._line_starts = starts
+        return self._line_starts
+
+    def rowcol(self, point):
+        starts = self._starts()
+        row = bisect.bisect_right(starts, point) - 1
+        return row, point - starts[row]
+
+    def text_point(self, row, col):
+        starts = self._starts()
+        row = max(0, min(row, len(starts) - 1))
+        return starts[row] + col
+
+    def line(self, x):
+        point = x.begin() if isinstance(x, Region) else x
+        start = self.text.rfind('\n', 0, point) + 1
+        end = self.text.find('\n', point)
+        if end == -1:
+            end = len(self.text)
+        return Region(start, end)
+
+    def full_line(self, x):
+        region = self.line(x)
+        return Region(region.a, min(region.b + 1, len(self.text)))
+
+    def lines(self, region):
+        result = []
+        point = region.begin()
+        while True:
+            line = self.line(point)
+            result.append(line)
+            if line.b >= region.end() or line.b >= len(self.text):
+                break
+            point = line.b + 1
+        return result
+
+    def score_selector(self, point, selector):
+        return 1 if selector in self.syntax else 0
+
+    def match_selector(self, point, selector):
+        return selector in self.syntax
+
+    def set_syntax_file(self, path):
+        self.syntax = path
+
+    def add_regions(self, key, regions, *args, **kwargs):
+        self._regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, []))
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def visible_region(self):
+        return Region(0, self.size())
+
+    def viewport_position(self):
+        return (0, 0)
+
+    def set_viewport_position(self, pos, animate=True):
+        pass
+
+    def show(self, x, show_surrounds=True):
+        pass
+
+    def run_command(self, name, args=None):
+        import sublime_plugin
+        self.commands.append((name, args))
+        cls = sublime_plugin.text_commands.get(name)
+        if cls is not None:
+            cls(self).run(Edit(), **(args or {}))
+
+
+class Window(object):
+    def __init__(self, views=None, folders=None, project_data=None):
+        self._views = list(views or [])
+        self._folders = list(folders or [])
+        self._project_data = project_data
+        self.panels = {}
+        self._active = None
+        for v in self._views:
+            v._window = self
+
+    def id(self):
+        return 1
+
+    def views(self):
+        return list(self._views)
+
+    def add_view(self, view):
+        view._window = self
+        self._views.append(view)
+        self._active = view
+
+    def active_view(self):
+        if self._active is not None:
+            return self._active
+        return self._views[0] if self._views else View()
+
+    def folders(self):
+        return list(self._folders)
+
+    def project_data(self):
+        return self._project_data
+
+    def project_file_name(self):
+        return None
+
+    def extract_variables(self):
+        return {}
+
+    def create_output_panel(self, name, unlisted=False):
+        panel = View(syntax='text.plain')
+        panel._window = self
+        self.panels[name] = panel
+        return panel
+
+    def find_output_panel(self, name):
+        return self.panels.get(name)
+
+    def run_command(self, name, args=None):
+        import sublime_plugin
+        cls = sublime_plugin.window_commands.get(name)
+        if cls is not None:
+            cls(self).run(**(args or {}))
+
+    def status_message(self, msg):
+        messages.append(msg)
+
+
+def active_window():
+    if not _windows:
+        _windows.append(Window())
+    return _windows[0]
+
+
+def windows():
+    return [active_window()]
+
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+    return _settings[name]
+
+
+def save_settings(name):
+    pass
+
+
+def set_timeout(callback, delay=0):
+    _timeouts.append(callback)
+
+
+def set_timeout_async(callback, delay=0):
+    _timeouts.append(callback)
+
+
+def run_timeouts():
+    while _timeouts:
+        _timeouts.pop(0)()
+
+
+def error_message(msg):
+    messages.append(msg)
+
+
+def status_message(msg):
+    messages.append(msg)
+
+
+def expand_variables(value, variables):
+    return value
+
+
+def cache_path():
+    path = os.path.join(tempfile.gettempdir(), 'sublime-stub-cache')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def packages_path():
+    return tempfile.gettempdir()
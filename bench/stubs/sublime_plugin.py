@@ -0,0 +1,49 @@
+"""
+In-memory stand-in for Sublime Text's `sublime_plugin` module.
+
+Commands register themselves by their snake_case name, just like in
+Sublime, so that `View.run_command` can find them.
+"""
+import re
+
+text_commands = {}
+window_commands = {}
+
+
+def command_name(cls):
+    """YapfDocumentCommand -> yapf_document."""
+    name = cls.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<!^)([A-Z])', r'_\1', name).lower()
+
+
+class TextCommand(object):
+    def __init__(self, view):
+        self.view = view
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        text_commands[command_name(cls)] = cls
+
+
+class WindowCommand(object):
+    def __init__(self, window):
+        self.window = window
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        window_commands[command_name(cls)] = cls
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class EventListener(object):
+    pass
+
+
+class ViewEventListener(object):
+    def __init__(self, view):
+        self.view = view
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+Sublime independent helpers for PyYapf.
+
+Nothing in here may import `sublime` or `sublime_plugin`.
+"""
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+`python -m pyyapf_core`, see cli.py.
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+The formatters PyYapf can run.
+
+A backend knows how to run its formatter on stdin, how to tell success from
+failure by the exit code and where an error message points to.  yapf is the
+default, the "formatter" setting selects another registered backend.
+"""
+import os
+import re
+import subprocess
+
+try:
+    from shutil import which
+except ImportError:
+    from backports.shutil_which import which
+
+from .ranges import merge_ranges
+from .styles import StyleFinder
+from .watchdog import Watchdog, session_kwargs
+
+
+class Backend(object):
+    """Base class of the backends."""
+
+    # value of the "formatter" setting
+    name = None
+
+    # setting with the command to run, the executables searched for on the
+    # PATH if it is empty
+    command_setting = None
+    executables = []
+
+    # can the "worker" and "api" engines run it (they use yapf's api)?
+    api = False
+
+    # does it understand yapf style files (from the "config" setting)?
+    custom_styles = False
+
+    # can `arguments` restrict formatting to several line ranges at once?
+    line_ranges = False
+
+    # does it always put the same blank lines between top-level definitions,
+    # so that large documents can be formatted in chunks (see chunks.py)?
+    chunks = False
+
+    def __init__(self):
+        """Start with an empty style cache."""
+        self.styles = StyleFinder()
+
+    def find(self, cmd):
+        """Return `cmd`, or the first of `executables` found on the PATH."""
+        cmd = os.path.expanduser(cmd or '')
+        for name in self.executables:
+            if cmd:
+                break
+            cmd = which(name)
+        return cmd
+
+    def arguments(self, style, lines=None, filename=None):
+        """
+        Arguments that make the command format stdin to stdout.
+
+        `style` is what `styles` found, `lines` optionally restricts
+        formatting to (start, end) line ranges.
+        """
+        raise NotImplementedError
+
+    def succeeded(self, returncode):
+        """Does the exit code mean that stdout is the formatted text?"""
+        return returncode == 0
+
+    def version(self, popen_args, watchdog=None, **kwargs):
+        """
+        Ask the command for its version (e.g. "yapf 0.43.0").
+
+        `watchdog` may kill it, `kwargs` are passed on to Popen.  Returns
+        None if that fails.
+        """
+        kwargs.update(session_kwargs())
+        if watchdog is None:
+            watchdog = Watchdog()
+        try:
+            popen = subprocess.Popen(
+                list(popen_args) + ['--version'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.PIPE,
+                **kwargs
+            )
+            watchdog.watch(popen)
+            stdout = popen.communicate()[0]
+        except (IOError, OSError):
+            return None
+        finally:
+            watchdog.done()
+        if watchdog.fired or popen.returncode != 0:
+            return None
+        return stdout.decode('utf-8', 'replace').strip() or None
+
+    def error_position(self, err_lines):
+        """Return the (line, column) an error points to, either may be None."""
+        return None, None
+
+
+# yapf: <stdin>:1:7: invalid syntax
+ERROR_POSITION_RE = re.compile(r':(\d+):(\d+): ')
+
+#   File "<unknown>", line 3
+# (but not traceback lines like: File "yapf/__init__.py", line 45, in main)
+SYNTAX_ERROR_LINE_RE = re.compile(r', line (\d+)$')
+
+
+class YapfBackend(Backend):
+    """yapf, as a process or through its api."""
+
+    name = 'yapf'
+    command_setting = 'yapf_command'
+    executables = ['yapf', 'yapf3', 'yapf.exe', 'yapf3.exe']
+    api = True
+    custom_styles = True
+    line_ranges = True
+    chunks = True
+
+    def arguments(self, style, lines=None, filename=None):
+        """yapf reads stdin unless given files."""
+        arguments = ['--style', style]
+        for start, end in lines or []:
+            arguments += ['--lines', '%d-%d' % (start, end)]
+        return arguments
+
+    def succeeded(self, returncode):
+        """Since yapf>=0.3, exit code 2 means changed, not error."""
+        return returncode in (0, 2)
+
+    def error_position(self, err_lines):
+        """Parse YAPF output to determine where an error occurred."""
+        msg = err_lines[-1]
+
+        # yapf.yapflib.errors.YapfError: /path/to/file.py:3:7: invalid syntax
+        match = ERROR_POSITION_RE.search(msg)
+        if match:
+            return int(match.group(1)), int(match.group(2)) or None
+
+        # yapf.yapflib.verifier.InternalError:
+        #     Missing parentheses in call to 'print' (<string>, line 2)
+        if '(<string>, line ' in msg:
+            return int(msg.rstrip(')').rsplit(None, 1)[1]) + 1, None
+
+        # lib2to3.pgen2.tokenize.TokenError: ('EOF in multi-line statement', (5, 0))
+        if msg.endswith('))'):
+            return int(msg.rstrip(')').rsplit(None, 2)[1].strip(',(')), None
+
+        #   File "<unknown>", line 3
+        #     if:
+        #       ^
+        # SyntaxError: invalid syntax
+        if len(err_lines) >= 4:
+            match = SYNTAX_ERROR_LINE_RE.search(err_lines[-4])
+            if match:
+                return int(match.group(1)), None
+        return None, None
+
+
+# ruff: error: Failed to parse at 1:7: Expected ...
+# (or "Failed to parse foo.py:1:7: ..." with --stdin-filename)
+RUFF_ERROR_POSITION_RE = re.compile(r'[: ](\d+):(\d+): ')
+
+
+class RuffBackend(Backend):
+    """
+    ruff's formatter ("ruff format"), which is (mostly) black compatible.
+
+    It is a lot faster than yapf but formats differently and only runs as a
+    process.  Its configuration is found like ruff does, in .ruff.toml,
+    ruff.toml or the [tool.ruff] section of pyproject.toml.
+    """
+
+    name = 'ruff'
+    command_setting = 'ruff_command'
+    executables = ['ruff', 'ruff.exe']
+
+    def __init__(self):
+        """ruff has its own configuration files."""
+        Backend.__init__(self)
+        self.styles = StyleFinder(
+            candidates=[
+                ('.ruff.toml', None),
+                ('ruff.toml', None),
+                ('pyproject.toml', re.compile(r'^\s*\[tool\.ruff[\].]', re.M)),
+            ],
+            user_style=None,
+            default=None
+        )
+
+    def arguments(self, style, lines=None, filename=None):
+        """
+        ruff formats a single range.
+
+        With several line ranges, everything from the first to the last is
+        formatted.
+        """
+        arguments = ['format']
+        if style:
+            arguments += ['--config', style]
+        if filename:
+            arguments += ['--stdin-filename', filename]
+        if lines:
+            lines = merge_ranges(lines)
+            arguments += ['--range', '%d-%d' % (lines[0][0], lines[-1][1] + 1)]
+        return arguments + ['-']
+
+    def error_position(self, err_lines):
+        """Parse ruff output to determine where an error occurred."""
+        match = RUFF_ERROR_POSITION_RE.search(err_lines[-1])
+        if match:
+            return int(match.group(1)), int(match.group(2)) or None
+        return None, None
+
+
+# "formatter" setting -> Backend
+BACKENDS = {}
+
+
+def register(backend):
+    """Make a backend available to the "formatter" setting."""
+    BACKENDS[backend.name] = backend
+
+
+def get_backend(name):
+    """Return the backend called `name`, None if there is no such backend."""
+    return BACKENDS.get(name or YapfBackend.name)
+
+
+register(YapfBackend())
+register(RuffBackend())
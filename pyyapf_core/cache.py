@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Content addressed cache of formatting results.
+
+Entries are keyed by a hash of everything that influences yapf's output
+(the source text, the style and the yapf installation) and live in a
+bounded in-memory LRU, optionally backed by a directory on disk.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 (sublime text 2)
+    from backports.ordereddict import OrderedDict
+
+
+# characters of the source encoded (and hashed) at a time
+HASH_CHUNK = 1 << 16
+
+
+def user_cache_dir(*names):
+    """
+    Directory for PyYapf's files in the user's own cache directory.
+
+    Unlike the temporary directory it is not shared with other users.
+    """
+    if os.name == 'nt':
+        root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'), '.cache'
+        )
+    return os.path.join(root, 'PyYapf', *names)
+
+
+def cache_key(text, *parts):
+    """
+    Hash `text` and arbitrary (JSON serializable) parts into a cache key.
+
+    The text is hashed piecewise so that no copy of a large document has
+    to be made.
+    """
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8'))
+    digest.update(('\n%d\n' % len(text)).encode('ascii'))
+    for start in range(0, len(text), HASH_CHUNK):
+        chunk = text[start:start + HASH_CHUNK]
+        digest.update(chunk.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class FormatCache(object):
+    """Memory LRU with an optional size bounded on-disk tier."""
+
+    def __init__(self, max_entries=64, directory=None, max_bytes=0):
+        """Create an empty cache, see configure() for the arguments."""
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.directory = None
+        self.disk_bytes = None
+        self.configure(max_entries, directory, max_bytes)
+
+    def configure(self, max_entries, directory=None, max_bytes=0):
+        """
+        (Re)configure limits.
+
+        `max_entries` bounds the memory tier, the disk tier is only used if
+        `directory` is given and `max_bytes` is positive.
+        """
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            if not (directory and max_bytes > 0):
+                directory = None
+            if directory != self.directory:
+                self.directory = directory
+                self.disk_bytes = None
+            self._trim_memory()
+            self._trim_disk()
+
+    def enabled(self):
+        """Is anything cached at all?"""
+        return self.max_entries > 0 or self.directory is not None
+
+    def get(self, key):
+        """Return the cached text for `key` or None."""
+        with self.lock:
+            text = self.memory.pop(key, None)
+            if text is None:
+                text = self._read_disk(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.memory[key] = text
+            self._trim_memory()
+            return text
+
+    def put(self, key, text):
+        """Store `text` under `key`."""
+        with self.lock:
+            self.memory.pop(key, None)
+            self.memory[key] = text
+            self._trim_memory()
+            self._write_disk(key, text)
+
+    def clear(self):
+        """Drop all entries (including the ones on disk)."""
+        with self.lock:
+            self.memory.clear()
+            for path, _, _ in self._disk_entries():
+                self._remove(path)
+            self.disk_bytes = 0 if self.directory else None
+
+    def stats(self):
+        """Human readable counters."""
+        return '%d hits, %d misses, %d evictions' % (
+            self.hits, self.misses, self.evictions
+        )
+
+    def _trim_memory(self):
+        while len(self.memory) > max(self.max_entries, 0):
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with io.open(path, encoding='utf-8', newline='') as fp:
+                text = fp.read()
+            # bump mtime, eviction removes the least recently used first
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return text
+
+    def _write_disk(self, key, text):
+        if not self.directory:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = self._path(key)
+            with io.open(path, 'w', encoding='utf-8', newline='') as fp:
+                fp.write(text)
+        except (IOError, OSError):
+            return
+        if self.disk_bytes is not None:
+            self.disk_bytes += os.path.getsize(path)
+        self._trim_disk()
+
+    def _disk_entries(self):
+        """List (path, size, mtime) of all entries on disk."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _trim_disk(self):
+        if not self.directory:
+            return
+        if self.disk_bytes is not None and self.disk_bytes <= self.max_bytes:
+            return
+
+        entries = self._disk_entries()
+        self.disk_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if self.disk_bytes <= self.max_bytes:
+                break
+            self._remove(path)
+            self.disk_bytes -= size
+            self.evictions += 1
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Splitting large modules into chunks that can be formatted independently.
+
+yapf formats every top-level statement on its own, the only thing that
+depends on neighbouring statements are the blank lines in between.  Chunks
+are therefore only split between two top-level `def`s or `class`es that are
+separated by nothing but blank lines: yapf always puts the same number of
+blank lines there (see `seam_blank_lines`), so that the formatted chunks
+can simply be joined.
+"""
+import ast
+import re
+
+# formatted to find out how many blank lines the style puts between
+# top-level definitions
+SEAM_PROBE = 'def a():\n    pass\ndef b():\n    pass\n'
+
+# regions yapf must leave alone may span chunks
+DISABLED_RE = re.compile(r'#\s*(yapf:\s*disable|fmt:\s*off)')
+
+DEFINITIONS = (ast.FunctionDef, ast.ClassDef) + (
+    (ast.AsyncFunctionDef,) if hasattr(ast, 'AsyncFunctionDef') else ()
+)
+
+
+def _first_line(node):
+    """First line of a statement, including decorators."""
+    decorators = getattr(node, 'decorator_list', [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def split_points(text):
+    """
+    List the (0-based) lines a module can be split at.
+
+    Returns None if the module can not be split at all.
+    """
+    if DISABLED_RE.search(text):
+        return None
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        # yapf will report this when formatting the module as a whole
+        return None
+
+    lines = text.splitlines()
+    points = []
+    body = tree.body
+    for previous, node in zip(body, body[1:]):
+        if not (isinstance(previous, DEFINITIONS) and
+                isinstance(node, DEFINITIONS)):
+            continue
+        start = _first_line(node) - 1
+        # walk back over blank lines, the line before them must belong to
+        # the previous definition (and not be a comment that yapf might
+        # attach to the next one)
+        line = start - 1
+        while line >= 0 and not lines[line].strip():
+            line -= 1
+        if not lines[line].lstrip().startswith('#'):
+            points.append(start)
+    return points
+
+
+def split_chunks(text, count):
+    """
+    Split a module into about `count` chunks of similar size.
+
+    Returns the list of chunks or None if the module can not be split.
+    """
+    points = split_points(text)
+    if not points or count < 2:
+        return None
+
+    lines = text.splitlines(True)
+    size = len(lines) / float(count)
+    boundaries = []
+    for point in points:
+        if point >= size * (len(boundaries) + 1):
+            boundaries.append(point)
+            if len(boundaries) == count - 1:
+                break
+    if not boundaries:
+        return None
+
+    chunks = []
+    begin = 0
+    for end in boundaries + [len(lines)]:
+        chunks.append(''.join(lines[begin:end]))
+        begin = end
+    return chunks
+
+
+def seam_blank_lines(formatted_probe):
+    """Number of blank lines between the definitions of SEAM_PROBE."""
+    lines = formatted_probe.splitlines()
+    return sum(1 for line in lines if not line.strip())
+
+
+def join_chunks(formatted, blank_lines):
+    """
+    Join formatted chunks with `blank_lines` blank lines in between.
+
+    Returns None if a chunk does not look like it was split at a seam.
+    """
+    parts = []
+    for chunk in formatted:
+        chunk = chunk.strip('\n')
+        if not chunk or not chunk[0].strip():
+            return None
+        parts.append(chunk)
+    return ('\n' * (blank_lines + 1)).join(parts) + '\n'
+
+
+def top_level_block(text, line):
+    """
+    Find the top-level statement (0-based) `line` belongs to.
+
+    Returns (first, end) with `end` excluded, without the blank lines and
+    comments that follow the statement, or None if the module does not
+    parse or `line` is not part of a statement.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+
+    lines = text.splitlines()
+    starts = [_first_line(node) - 1 for node in tree.body] + [len(lines)]
+    for first, end in zip(starts, starts[1:]):
+        if first <= line < end:
+            break
+    else:
+        return None
+
+    while end > first + 1 and (
+        not lines[end - 1].strip() or lines[end - 1].startswith('#')
+    ):
+        end -= 1
+    if line >= end:
+        return None
+    return first, end
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Run PyYapf from the command line, e.g. in pre-commit hooks or CI.
+
+Files are formatted exactly like the plugin formats them: the same settings
+(see pyyapf_core.settings), the same style lookup and "config" style file,
+the same "onsave_include_fn_glob" / "onsave_ignore_fn_glob" filtering and
+the same "default_encoding" and "formatter".  The formatter always runs as a
+separate process.
+
+    python -m pyyapf_core src/ setup.py
+    python -m pyyapf_core --check --project my.sublime-project src/
+    python -m pyyapf_core --check - < module.py
+
+Directories are searched for *.py files like "PyYapf: Format Project" does,
+"-" (or no paths at all) formats stdin to stdout.  Results are printed as
+soon as each file is done.  The exit code follows yapf's convention: 0 on
+success, 1 if any file could not be formatted and, with --check, 2 if files
+would be reformatted.
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import shlex
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .backends import get_backend
+from .cache import user_cache_dir
+from .files import find_python_files, read_source, write_source
+from .policy import SavePolicy
+from .runner import run_formatter
+from .settings import DEFAULT_SETTINGS, Settings, load, project_settings
+from .styles import save_style_to_cache
+from .syntax import syntax_error_lines
+from .watchdog import Killed, Watchdog
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_CHANGED = 2
+
+STDIN = '-'
+
+
+class Formatter(object):
+    """Formats files with PyYapf settings, outside of Sublime Text."""
+
+    def __init__(self, settings, check=False):
+        """Resolve everything that does not depend on the file."""
+        self.settings = settings
+        self.check = check
+        self.encoding = settings.get('default_encoding', 'UTF-8')
+
+        name = settings.get('formatter')
+        self.backend = get_backend(name)
+        if self.backend is None:
+            raise OSError('unknown formatter %r' % name)
+        cmd = self.backend.find(settings.get(self.backend.command_setting))
+        if not cmd:
+            raise OSError("%s not found, install it or set '%s'" % (
+                self.backend.name, self.backend.command_setting
+            ))
+        self.popen_args = shlex.split(cmd, posix=False)
+
+        config = settings.get('config')
+        if config and self.backend.custom_styles:
+            self.custom_style = save_style_to_cache(
+                config, user_cache_dir('styles')
+            )
+        else:
+            self.custom_style = None
+
+        self.policy = SavePolicy(
+            settings.get('onsave_include_fn_glob', []),
+            settings.get('onsave_ignore_fn_glob', [])
+        )
+
+        self.env = os.environ.copy()
+        self.env['LANG'] = str(self.encoding)
+
+        # watchdogs of the yapf processes running right now
+        self.watchdogs = set()
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+    def paths(self, args):
+        """Expand directories and drop files excluded by the settings."""
+        seen = set()
+        for arg in args:
+            if arg == STDIN:
+                paths = [arg]
+            elif os.path.isdir(arg):
+                paths = find_python_files([arg])
+            else:
+                paths = [arg]
+            for path in paths:
+                if path in seen:
+                    continue
+                seen.add(path)
+                if path == STDIN or not self.policy.excluded(
+                    os.path.abspath(path)
+                ):
+                    yield path
+
+    def style(self, path):
+        """The style to format `path` (None: stdin) with."""
+        if self.custom_style:
+            return self.custom_style
+        directory = os.path.dirname(os.path.abspath(path)) if path else None
+        return self.backend.styles.find(directory or os.getcwd())[0]
+
+    def format_text(self, text, path=None):
+        """
+        Format text, like the plugin's "process" engine.
+
+        Returns (text, err_lines).
+        """
+        if self.settings.get('syntax_preflight'):
+            err_lines = syntax_error_lines(text)
+            if err_lines is not None:
+                return None, err_lines
+
+        watchdog = Watchdog(self.settings.get('timeout', 0) or None)
+        with self.lock:
+            if self.cancelled:
+                watchdog.cancel()
+            self.watchdogs.add(watchdog)
+        try:
+            return run_formatter(
+                self.backend,
+                self.popen_args,
+                text,
+                self.encoding,
+                self.style(path),
+                filename=path and os.path.abspath(path),
+                cwd=os.path.dirname(os.path.abspath(path)) if path else None,
+                env=self.env,
+                watchdog=watchdog
+            )
+        except OSError as err:
+            return None, ['OSError: %s' % err]
+        except UnicodeEncodeError as err:
+            return None, ['UnicodeEncodeError: %s' % err]
+        except Killed as err:
+            if err.reason == 'timeout':
+                return None, [
+                    'yapf did not finish within %s seconds' %
+                    self.settings.get('timeout')
+                ]
+            return None, ['Formatting cancelled']
+        finally:
+            with self.lock:
+                self.watchdogs.discard(watchdog)
+
+    def format_file(self, path):
+        """
+        Format a file (in place unless checking).
+
+        Returns (changed, err_lines).
+        """
+        try:
+            text, crlf = read_source(path, self.encoding)
+        except UnicodeDecodeError as err:
+            return False, ['UnicodeDecodeError: %s' % err]
+        except (IOError, OSError) as err:
+            return False, [str(err)]
+
+        formatted, err_lines = self.format_text(text, path)
+        if err_lines or formatted == text:
+            return False, err_lines
+        if not self.check:
+            try:
+                write_source(path, formatted, self.encoding, crlf)
+            except (IOError, OSError) as err:
+                return False, [str(err)]
+        return True, None
+
+    def cancel(self):
+        """Kill running yapf processes and do not start new ones."""
+        with self.lock:
+            self.cancelled = True
+            for watchdog in self.watchdogs:
+                watchdog.cancel()
+
+    def run(self, paths, jobs, results):
+        """
+        Format files with `jobs` threads.
+
+        (path, changed, err_lines) is put on the `results` queue for every
+        file as soon as it is done, whatever happens.
+        """
+        pending = queue.Queue()
+        for path in paths:
+            pending.put(path)
+
+        def work():
+            while not self.cancelled:
+                try:
+                    path = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result = self.format_file(path)
+                except Exception as err:  # pylint: disable=broad-except
+                    result = False, ['%s: %s' % (type(err).__name__, err)]
+                results.put((path, ) + result)
+
+        threads = []
+        for _ in range(min(jobs, pending.qsize())):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+
+def load_settings(args):
+    """Layer the default, user and project settings."""
+    layers = [load(DEFAULT_SETTINGS)]
+    layers += [load(path) for path in args.settings]
+    if args.project:
+        layers.append(project_settings(args.project))
+    if args.formatter:
+        layers.append({'formatter': args.formatter})
+    if args.yapf_command:
+        layers.append({'yapf_command': args.yapf_command})
+    return Settings(layers)
+
+
+def positive_int(value):
+    """argparse type of counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError('%r is not a positive number' % value)
+    return number
+
+
+def report(path, err_lines, stream):
+    """Print why a file could not be formatted."""
+    for line in err_lines:
+        if '<stdin>' in line:
+            line = line.replace('<stdin>', path)
+        else:
+            line = '%s: %s' % (path, line)
+        print('error: %s' % line, file=stream)
+    stream.flush()
+
+
+def format_stdin(formatter, args):
+    """Format stdin to stdout."""
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    path = args.stdin_filename
+    try:
+        text = stdin.read().decode(formatter.encoding)
+    except UnicodeDecodeError as err:
+        report(path or STDIN, ['UnicodeDecodeError: %s' % err], sys.stderr)
+        return EXIT_ERROR
+    text = text.replace('\r\n', '\n')
+
+    formatted, err_lines = formatter.format_text(text, path)
+    if err_lines:
+        report(path or STDIN, err_lines, sys.stderr)
+        return EXIT_ERROR
+    if args.check:
+        return EXIT_OK if formatted == text else EXIT_CHANGED
+    stdout.write(formatted.encode(formatter.encoding))
+    stdout.flush()
+    return EXIT_OK
+
+
+def main(argv=None):
+    """Entry point, returns the exit code."""
+    parser = argparse.ArgumentParser(
+        prog='python -m pyyapf_core',
+        description='Format python files the way PyYapf does.'
+    )
+    parser.add_argument(
+        'paths', nargs='*', help='files and directories, "-" for stdin'
+    )
+    parser.add_argument(
+        '--check', action='store_true',
+        help='do not change anything, exit with 2 if files would change'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=positive_int,
+        help='files formatted at the same time (default: "project_jobs", '
+        'one per cpu if that is 0)'
+    )
+    parser.add_argument(
+        '--settings', action='append', default=[], metavar='FILE',
+        help='PyYapf.sublime-settings overriding the defaults (repeatable)'
+    )
+    parser.add_argument(
+        '--project', metavar='FILE',
+        help='.sublime-project whose "PyYapf" settings apply'
+    )
+    parser.add_argument('--formatter', help='overrides "formatter"')
+    parser.add_argument('--yapf-command', help='overrides "yapf_command"')
+    parser.add_argument(
+        '--stdin-filename',
+        help='name of the file read from stdin (for the style lookup)'
+    )
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args)
+    try:
+        formatter = Formatter(settings, args.check)
+    except OSError as err:
+        print('error: %s' % err, file=sys.stderr)
+        return EXIT_ERROR
+
+    paths = list(formatter.paths(args.paths or [STDIN]))
+    if STDIN in paths:
+        if len(paths) > 1:
+            parser.error('"-" can not be combined with other paths')
+        return format_stdin(formatter, args)
+
+    jobs = args.jobs or settings.get('project_jobs')
+    jobs = max(jobs or multiprocessing.cpu_count(), 1)
+    results = queue.Queue()
+    formatter.run(paths, jobs, results)
+
+    status = EXIT_OK
+    try:
+        for _ in paths:
+            # a timeout keeps KeyboardInterrupt working on python 2
+            while True:
+                try:
+                    path, changed, err_lines = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    pass
+            if err_lines:
+                report(path, err_lines, sys.stderr)
+                status = EXIT_ERROR
+            elif changed:
+                print('%s %s' % (
+                    'would reformat' if args.check else 'reformatted', path
+                ))
+                sys.stdout.flush()
+                if args.check and status == EXIT_OK:
+                    status = EXIT_CHANGED
+    except KeyboardInterrupt:
+        formatter.cancel()
+        return EXIT_ERROR
+    return status
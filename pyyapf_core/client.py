@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Plugin side of the long-lived yapf worker (see worker.py).
+"""
+import collections
+import os
+import re
+import subprocess
+import threading
+import time
+
+from .watchdog import Killed, session_kwargs
+from .worker import read_frame, write_frame
+
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'worker.py'
+)
+
+# python, python3, python3.11, pythonw.exe, pypy3, ...
+PYTHON_RE = re.compile(r'^(python|pypy)[\d.]*w?(\.exe)?$', re.I)
+
+
+def python_command(args):
+    """
+    Return `args` if they run a python interpreter, None otherwise.
+
+    `args` may come from a shebang like "/usr/bin/env python3 -E", shell
+    wrappers (e.g. pyenv shims) can not run the worker script.
+    """
+    args = list(args)
+    if args and os.path.basename(args[0]) in ('env', 'env.exe'):
+        args = args[1:]
+        while args and (args[0].startswith('-') or '=' in args[0]):
+            args = args[1:]
+    if args and PYTHON_RE.match(os.path.basename(args[0])):
+        return args
+    return None
+
+
+class WorkerError(Exception):
+    """The worker died or spoke gibberish."""
+
+
+class Worker(object):
+    """A single yapf worker process."""
+
+    def __init__(self, python_args, env=None, startupinfo=None):
+        """Remember how to start the worker, but do not start it yet."""
+        self.args = list(python_args) + ['-u', WORKER_SCRIPT]
+        self.env = env
+        self.startupinfo = startupinfo
+        self.popen = None
+        self.stderr = collections.deque(maxlen=50)
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+        # number of requests answered (by any of its processes)
+        self.responses = 0
+
+    def alive(self):
+        """Is the process running?"""
+        return self.popen is not None and self.popen.poll() is None
+
+    def start(self):
+        """(Re)start the worker process."""
+        self.stop()
+        self.popen = subprocess.Popen(
+            self.args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.env,
+            startupinfo=self.startupinfo,
+            **session_kwargs()
+        )
+
+        # drain stderr so that a chatty worker cannot block on a full pipe
+        self.stderr.clear()
+        thread = threading.Thread(
+            target=self._drain, args=(self.popen.stderr, )
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _drain(self, stream):
+        """Keep the last lines the worker wrote to stderr."""
+        for line in iter(stream.readline, b''):
+            self.stderr.append(line.decode('utf-8', 'replace').rstrip())
+
+    def stop(self):
+        """Terminate the worker process (if any)."""
+        popen, self.popen = self.popen, None
+        if popen is None:
+            return
+        try:
+            popen.stdin.close()
+            if popen.poll() is None:
+                popen.terminate()
+            popen.wait()
+        except (OSError, IOError):
+            pass
+
+    def request(self, message, watchdog=None):
+        """
+        Send a request and wait for the response.
+
+        The worker is killed (and Killed raised) if `watchdog` fires.
+        """
+        with self.lock:
+            if not self.alive():
+                self.start()
+            self.last_used = time.time()
+            if watchdog is not None:
+                watchdog.watch(self.popen)
+            try:
+                write_frame(self.popen.stdin, message)
+                response = read_frame(self.popen.stdout)
+            except (OSError, IOError, ValueError) as err:
+                self.stop()
+                if watchdog is not None and watchdog.fired:
+                    raise Killed(watchdog.fired)
+                raise WorkerError(str(err))
+            finally:
+                if watchdog is not None:
+                    watchdog.done()
+            if watchdog is not None and watchdog.fired:
+                self.stop()
+                raise Killed(watchdog.fired)
+            if response is None:
+                self.popen.wait()
+                self.stop()
+                raise WorkerError(
+                    '\n'.join(self.stderr) or 'worker exited unexpectedly'
+                )
+            self.last_used = time.time()
+            self.responses += 1
+            return response
+
+
+class WorkerPool(object):
+    """One worker per interpreter/style combination."""
+
+    def __init__(self):
+        """Start out empty, workers are started lazily."""
+        self.workers = {}
+        self.lock = threading.Lock()
+
+        # interpreters whose worker never answered, see forget_failures
+        self.failed = set()
+
+        # the pending reap, see reap_later
+        self.reaper = None
+
+    def usable(self, python_args):
+        """Is a worker for this interpreter worth trying?"""
+        return tuple(python_args) not in self.failed
+
+    def forget_failures(self):
+        """Try interpreters that failed before again (e.g. new settings)."""
+        with self.lock:
+            self.failed.clear()
+
+    def request(self, key, python_args, message, watchdog=None, **kwargs):
+        """
+        Send `message` to the worker identified by `key`.
+
+        A worker that crashed is restarted once before giving up (but not
+        one killed by `watchdog`).  If a worker can not even be started for
+        an interpreter (e.g. yapf is not installed for it), the interpreter
+        is not tried again until forget_failures is called.
+        """
+        with self.lock:
+            if tuple(python_args) in self.failed:
+                raise WorkerError('the worker failed before')
+            worker = self.workers.get(key)
+            if worker is None:
+                worker = Worker(python_args, **kwargs)
+                self.workers[key] = worker
+
+        try:
+            return worker.request(message, watchdog)
+        except (OSError, WorkerError):
+            if not worker.responses:
+                # never worked, e.g. yapf is not installed for this python
+                with self.lock:
+                    self.failed.add(tuple(python_args))
+                    self.workers.pop(key, None)
+                raise
+        # the worker may have crashed on a previous request, retry once
+        return worker.request(message, watchdog)
+
+    def reap(self, max_idle):
+        """Stop workers that were not used for `max_idle` seconds."""
+        deadline = time.time() - max_idle
+        with self.lock:
+            for key, worker in list(self.workers.items()):
+                if worker.last_used < deadline and not worker.lock.locked():
+                    worker.stop()
+                    del self.workers[key]
+
+    def reap_later(self, max_idle):
+        """
+        Reap workers idle for `max_idle` seconds, `max_idle` seconds from now.
+
+        Only one reap is pending at a time, it schedules the next one as
+        long as workers are left.
+        """
+        with self.lock:
+            if self.reaper is not None:
+                return
+            self.reaper = threading.Timer(
+                max(max_idle, 1), self._reap_pending, (max_idle, )
+            )
+            self.reaper.daemon = True
+            self.reaper.start()
+
+    def _reap_pending(self, max_idle):
+        with self.lock:
+            self.reaper = None
+        self.reap(max_idle)
+        with self.lock:
+            workers_left = bool(self.workers)
+        if workers_left:
+            self.reap_later(max_idle)
+
+    def shutdown(self):
+        """Stop all workers."""
+        with self.lock:
+            if self.reaper is not None:
+                self.reaper.cancel()
+                self.reaper = None
+            for worker in self.workers.values():
+                worker.stop()
+            self.workers.clear()
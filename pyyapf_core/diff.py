@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Line based diffing, so that only changed lines have to be replaced.
+
+difflib.SequenceMatcher alone gets very slow on large files with many
+scattered changes (which is exactly what reformatting produces), so lines
+are first anchored on lines that are unique on both sides (as in patience
+diff) and SequenceMatcher is only used on the small gaps in between.
+"""
+import bisect
+import difflib
+import re
+
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@', re.M)
+
+# largest gap (lines on one side times lines on the other) handed to
+# SequenceMatcher, bigger gaps without unique lines are replaced as a whole
+MAX_GAP = 10000
+
+
+def _unique_lcs(a, b, alo, ahi, blo, bhi):
+    """Longest common subsequence of lines unique to both ranges."""
+    seen = {}
+    for i in range(alo, ahi):
+        count, _, j = seen.get(a[i], (0, None, None))
+        seen[a[i]] = (count + 1, i, j)
+    for j in range(blo, bhi):
+        count, i, other = seen.get(b[j], (0, None, None))
+        if i is None:
+            continue
+        seen[b[j]] = (count, i, j if other is None else False)
+
+    pairs = sorted(
+        (i, j) for count, i, j in seen.values()
+        if count == 1 and j is not None and j is not False
+    )
+
+    # patience sorting: longest increasing subsequence of j
+    tails = []
+    tail_pairs = []
+    previous = {}
+    for pair in pairs:
+        pos = bisect.bisect_left(tails, pair[1])
+        previous[pair] = tail_pairs[pos - 1] if pos else None
+        if pos == len(tails):
+            tails.append(pair[1])
+            tail_pairs.append(pair)
+        else:
+            tails[pos] = pair[1]
+            tail_pairs[pos] = pair
+
+    result = []
+    pair = tail_pairs[-1] if tail_pairs else None
+    while pair is not None:
+        result.append(pair)
+        pair = previous[pair]
+    result.reverse()
+    return result
+
+
+def _match(a, b, alo, ahi, blo, bhi, out):
+    """Append matching (i, j) line pairs of a[alo:ahi], b[blo:bhi] to out."""
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        out.append((alo, blo))
+        alo += 1
+        blo += 1
+
+    tail = []
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        tail.append((ahi, bhi))
+
+    if alo < ahi and blo < bhi:
+        anchors = _unique_lcs(a, b, alo, ahi, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                _match(a, b, alo, i, blo, j, out)
+                out.append((i, j))
+                alo, blo = i + 1, j + 1
+            _match(a, b, alo, ahi, blo, bhi, out)
+        elif (ahi - alo) * (bhi - blo) <= MAX_GAP:
+            matcher = difflib.SequenceMatcher(
+                None, a[alo:ahi], b[blo:bhi], False
+            )
+            for i, j, size in matcher.get_matching_blocks():
+                for k in range(size):
+                    out.append((alo + i + k, blo + j + k))
+
+    out.extend(reversed(tail))
+
+
+def hunks(old, new):
+    """
+    List the edits that turn `old` into `new`.
+
+    Every edit is a tuple (begin, end, text) meaning that old[begin:end]
+    is replaced by text.  Edits are sorted back to front, so applying them
+    in order never shifts an edit that is yet to be applied.
+    """
+    if old == new:
+        return []
+
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+
+    matches = []
+    _match(old_lines, new_lines, 0, len(old_lines), 0, len(new_lines), matches)
+    matches.append((len(old_lines), len(new_lines)))
+
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    edits = []
+    i = j = 0
+    for next_i, next_j in matches:
+        if next_i > i or next_j > j:
+            edits.append(
+                (offsets[i], offsets[next_i], ''.join(new_lines[j:next_j]))
+            )
+        i, j = next_i + 1, next_j + 1
+    edits.reverse()
+    return edits
+
+
+def map_point(point, begin, old_len, new_len):
+    """Where does `point` end up after replacing old_len chars at begin?"""
+    if point >= begin + old_len:
+        return point + new_len - old_len
+    if point > begin:
+        return begin + min(point - begin, new_len)
+    return point
+
+
+def changed_regions(changes):
+    """
+    Where the text of a series of replacements ends up.
+
+    `changes` are (begin, end, text) tuples applied one after the other,
+    their positions refer to the text as it was right before each of them.
+    Returns one (begin, end) region per change, in the final text.
+    """
+    regions = []
+    for begin, end, text in changes:
+        old_len = end - begin
+        regions = [
+            (map_point(a, begin, old_len, len(text)),
+             map_point(b, begin, old_len, len(text)))
+            for a, b in regions
+        ]
+        regions.append((begin, begin + len(text)))
+    return regions
+
+
+def unified_diff(old, new, name, first_line=1, context=2):
+    """
+    Unified diff of `old` and `new`, for showing to the user.
+
+    The texts start at `first_line` of the file `name`, line numbers in the
+    hunk headers are shifted accordingly.
+    """
+    def lines(text):
+        result = text.splitlines(True)
+        if result and not result[-1].endswith('\n'):
+            result[-1] += '\n'
+        return result
+
+    diff = ''.join(difflib.unified_diff(
+        lines(old), lines(new), 'a/%s' % name, 'b/%s' % name, n=context
+    ))
+
+    def shift(match):
+        old_start, old_count, new_start, new_count = match.groups()
+        return '@@ -%d%s +%d%s @@' % (
+            int(old_start) + first_line - 1, old_count or '',
+            int(new_start) + first_line - 1, new_count or ''
+        )
+
+    return HUNK_HEADER_RE.sub(shift, diff)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Finding, reading and writing the python files of a project.
+"""
+import os
+
+from .policy import compile_globs
+
+# version control and tool directories that never contain project sources
+SKIP_DIRS = set([
+    '.bzr', '.git', '.hg', '.svn', '_darcs', 'CVS', '__pycache__',
+    '.mypy_cache', '.nox', '.pytest_cache', '.tox', 'node_modules'
+])
+
+
+def is_virtualenv(path):
+    """Does `path` look like a virtualenv (or venv)?"""
+    return (
+        os.path.isfile(os.path.join(path, 'pyvenv.cfg')) or
+        os.path.isfile(os.path.join(path, 'bin', 'activate')) or
+        os.path.isfile(os.path.join(path, 'Scripts', 'activate'))
+    )
+
+
+def find_python_files(folders, ignore_globs=(), cancelled=None):
+    """
+    Yield the *.py files below `folders`.
+
+    Files matching any of `ignore_globs`, version control directories and
+    virtualenvs are skipped.  `cancelled` is an optional callable that stops
+    the walk once it returns True.
+    """
+    ignore = compile_globs(ignore_globs)
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            if cancelled is not None and cancelled():
+                return
+            dirs[:] = sorted(
+                name for name in dirs
+                if name not in SKIP_DIRS and
+                not is_virtualenv(os.path.join(root, name))
+            )
+            for name in sorted(files):
+                if not name.endswith('.py'):
+                    continue
+                path = os.path.join(root, name)
+                if ignore is not None and ignore.match(os.path.normcase(path)):
+                    continue
+                yield path
+
+
+def read_source(path, encoding):
+    """
+    Read a python file.
+
+    Returns (text, crlf): the text always has unix newlines, `crlf` tells
+    whether the file had windows newlines.  Raises UnicodeDecodeError if the
+    file is not in `encoding`.
+    """
+    with open(path, 'rb') as fp:
+        text = fp.read().decode(encoding)
+    crlf = '\r\n' in text
+    if crlf:
+        text = text.replace('\r\n', '\n')
+    return text, crlf
+
+
+def write_source(path, text, encoding, crlf=False):
+    """Write a python file read with `read_source`."""
+    if crlf:
+        text = text.replace('\n', '\r\n')
+    with open(path, 'wb') as fp:
+        fp.write(text.encode(encoding))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Run yapf inside the Sublime Text plugin host.
+
+This only works if Sublime's own python can import yapf, either because it
+is installed for it or because a compatible site-packages directory was
+configured.  Requests and responses are the same as for the worker.
+"""
+import sys
+import threading
+
+from .worker import handle_request
+
+# yapf keeps the active style in a module global, so format one at a time
+LOCK = threading.Lock()
+
+# site-packages combinations yapf could not be imported from
+FAILED = set()
+
+
+def available(paths):
+    """Can yapf_api be imported (after adding `paths` to sys.path)?"""
+    key = tuple(paths)
+    if key in FAILED:
+        return False
+
+    added = [path for path in paths if path not in sys.path]
+    sys.path.extend(added)
+    try:
+        from yapf.yapflib import yapf_api  # noqa: F401 pylint: disable=unused-import
+    except Exception:  # pylint: disable=broad-except
+        for path in added:
+            sys.path.remove(path)
+        FAILED.add(key)
+        return False
+    return True
+
+
+def request(message):
+    """Format a single request in-process."""
+    with LOCK:
+        return handle_request(message)
+
+
+def version():
+    """Version of the yapf imported by available()."""
+    return request({'version': True}).get('version')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Background jobs.
+
+Jobs are keyed (usually by view id): submitting a job for a key that still
+has a job waiting replaces the waiting one, so repeated requests for the
+same view coalesce into a single run.  Waiting jobs run in order of their
+priority, then in the order they were submitted.
+"""
+import collections
+import threading
+import traceback
+
+
+class JobQueue(object):
+    """A small pool of daemon threads running keyed, coalescing jobs."""
+
+    def __init__(self, workers=1):
+        """Threads are started lazily on the first submit."""
+        self.workers = workers
+        self.threads = []
+        self.order = collections.deque()
+        self.waiting = {}
+        self.priorities = {}
+        self.running = set()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Run func(*args) in the background.
+
+        Jobs with a higher `priority` keyword argument (default 0) run
+        first.  Returns False if the job replaced a job that was still
+        waiting.
+        """
+        priority = kwargs.pop('priority', 0)
+        with self.condition:
+            replaced = key in self.waiting
+            if not replaced:
+                self.order.append(key)
+            self.waiting[key] = (func, args)
+            self.priorities[key] = priority
+            self._start_threads()
+            self.condition.notify()
+            return not replaced
+
+    def cancel(self, key):
+        """Drop the waiting job for `key` (a running job is not stopped)."""
+        with self.condition:
+            if self.waiting.pop(key, None) is None:
+                return False
+            del self.priorities[key]
+            self.order.remove(key)
+            return True
+
+    def busy(self, key):
+        """Is a job for `key` waiting or running?"""
+        with self.condition:
+            return key in self.waiting or key in self.running
+
+    def shutdown(self):
+        """Drop waiting jobs and let the threads exit."""
+        with self.condition:
+            self.stopped = True
+            self.waiting.clear()
+            self.priorities.clear()
+            self.order.clear()
+            self.condition.notify_all()
+
+    def _start_threads(self):
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _next(self):
+        """Wait for the first job whose key is not running already."""
+        with self.condition:
+            while True:
+                if self.stopped:
+                    return None, None
+                best = None
+                for key in self.order:
+                    if key not in self.running and (
+                        best is None or
+                        self.priorities[key] > self.priorities[best]
+                    ):
+                        best = key
+                if best is not None:
+                    self.order.remove(best)
+                    self.running.add(best)
+                    del self.priorities[best]
+                    return best, self.waiting.pop(best)
+                self.condition.wait()
+
+    def _work(self):
+        while True:
+            key, job = self._next()
+            if job is None:
+                return
+            func, args = job
+            try:
+                func(*args)
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    self.running.discard(key)
+                    self.condition.notify_all()
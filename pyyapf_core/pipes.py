@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Feeding (large) text to a process without encoding it all at once.
+"""
+import codecs
+import threading
+
+# characters encoded (and written) at a time
+CHUNK_SIZE = 1 << 18
+
+
+def _read(stream, output, name):
+    output[name] = stream.read()
+
+
+def communicate(popen, text, encoding, chunk_size=CHUNK_SIZE):
+    """
+    Like popen.communicate(text.encode(encoding)), with less memory.
+
+    The text is encoded chunk by chunk straight into the pipe while
+    stdout and stderr are read in the background.  Returns (stdout,
+    stderr) as bytes.  If the text can not be encoded the process is killed
+    and the UnicodeEncodeError raised (with positions relative to `text`).
+    """
+    output = {}
+    readers = []
+    for name in ('stdout', 'stderr'):
+        reader = threading.Thread(
+            target=_read, args=(getattr(popen, name), output, name)
+        )
+        reader.daemon = True
+        reader.start()
+        readers.append(reader)
+
+    encoder = codecs.getincrementalencoder(encoding)()
+    start = 0
+    try:
+        while start < len(text):
+            popen.stdin.write(encoder.encode(text[start:start + chunk_size]))
+            start += chunk_size
+        popen.stdin.write(encoder.encode('', True))
+    except UnicodeEncodeError as err:
+        popen.kill()
+        raise UnicodeEncodeError(
+            err.encoding, text, start + err.start, start + err.end, err.reason
+        )
+    except (IOError, OSError):
+        # the process exited (or was killed) early, stderr tells why
+        pass
+    finally:
+        try:
+            popen.stdin.close()
+        except (IOError, OSError):
+            pass
+        # the readers are done once the process closes its end of the pipes
+        for reader in readers:
+            reader.join()
+        popen.wait()
+    return output.get('stdout', b''), output.get('stderr', b'')
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Deciding what to do with a file when it is saved.
+"""
+import fnmatch
+import os
+import re
+
+
+def compile_globs(globs):
+    """
+    Compile fnmatch style globs into a single regex (None if no globs).
+
+    Like fnmatch.fnmatch, matching is case insensitive where file names are.
+    Match os.path.normcase(path) against the result.
+    """
+    if not globs:
+        return None
+    return re.compile('|'.join(
+        '(?:%s)' % fnmatch.translate(os.path.normcase(glob)) for glob in globs
+    ))
+
+
+class SavePolicy(object):
+    """What to do on save, by file name and size."""
+
+    def __init__(
+        self, include=(), exclude=(), max_lines=0, max_size=0,
+        large_files='skip'
+    ):
+        """Compile the globs, 0 means no limit."""
+        self.include = compile_globs(include)
+        self.exclude = compile_globs(exclude)
+        self.max_lines = max_lines
+        self.max_size = max_size
+        self.large_files = large_files
+
+    def excluded(self, path):
+        """Is the file left alone because of its name?"""
+        if not path:
+            return False
+        path = os.path.normcase(path)
+        if self.include is not None and not self.include.match(path):
+            return True
+        return bool(self.exclude is not None and self.exclude.match(path))
+
+    def large(self, size, lines):
+        """Is the file too large to be formatted as usual?"""
+        return bool(
+            (self.max_size and size > self.max_size) or
+            (self.max_lines and lines > self.max_lines)
+        )
+
+    def action(self, path, size, lines):
+        """
+        Return what to do when saving a file.
+
+        This is "exclude" for excluded files, `large_files` for large ones
+        and "format" for everything else.
+        """
+        if self.excluded(path):
+            return 'exclude'
+        if self.large(size, lines):
+            return self.large_files
+        return 'format'
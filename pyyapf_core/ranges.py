@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Sets of (inclusive) line ranges.
+"""
+
+
+def merge_ranges(ranges):
+    """Merge overlapping and adjacent (start, end) ranges, sorted."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(ranges, removed):
+    """Remove the lines in `removed` from `ranges`."""
+    result = []
+    removed = merge_ranges(removed)
+    for start, end in merge_ranges(ranges):
+        for rstart, rend in removed:
+            if rend < start or rstart > end:
+                continue
+            if rstart > start:
+                result.append((start, rstart - 1))
+            start = rend + 1
+            if start > end:
+                break
+        if start <= end:
+            result.append((start, end))
+    return result
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Running a formatter as a separate process.
+
+This is the plugin's "process" engine and what the command line runner
+does, so that both produce (and report) exactly the same.
+"""
+import os
+import subprocess
+
+from .pipes import communicate
+from .watchdog import Killed, Watchdog, session_kwargs
+
+
+def run_formatter(
+    backend, popen_args, text, encoding, style, lines=None, filename=None,
+    cwd=None, env=None, startupinfo=None, watchdog=None
+):
+    """
+    Format `text` by piping it through the `backend`'s command.
+
+    `popen_args` is the command, `style`, `lines` and `filename` become
+    its arguments.  `watchdog` (if given) may kill the process.
+
+    Returns (text, err_lines).  Raises OSError if the command can not be
+    started, UnicodeEncodeError if `text` can not be encoded and Killed if
+    the watchdog fired.
+    """
+    popen = subprocess.Popen(
+        list(popen_args) + backend.arguments(style, lines, filename),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        startupinfo=startupinfo,
+        **session_kwargs()
+    )
+
+    if watchdog is None:
+        watchdog = Watchdog()
+    watchdog.watch(popen)
+    try:
+        # encode text (in chunks, straight into the pipe)
+        stdout, stderr = communicate(popen, text, encoding)
+    finally:
+        watchdog.done()
+    if watchdog.fired:
+        raise Killed(watchdog.fired)
+
+    # handle errors
+    if not backend.succeeded(popen.returncode):
+        stderr = stderr.decode(encoding, 'replace')
+        return None, stderr.replace(os.linesep, '\n').splitlines()
+
+    text = stdout.decode(encoding)
+    del stdout
+
+    # adjust newlines
+    if os.linesep != '\n' and '\r' in text:
+        text = text.replace(os.linesep, '\n')
+    return text, None
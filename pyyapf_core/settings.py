@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Reading PyYapf settings without Sublime Text.
+
+Sublime settings and project files are JSON with comments and trailing
+commas.  Settings are layered the way the plugin resolves them: the
+defaults shipped with PyYapf, then the user's settings, then the "PyYapf"
+section of the project's "settings".
+"""
+import json
+import os
+import re
+
+SETTINGS_FILE = 'PyYapf.sublime-settings'
+
+# the section of a project's "settings" that overrides the plugin settings
+PROJECT_KEY = 'PyYapf'
+
+DEFAULT_SETTINGS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), SETTINGS_FILE
+)
+
+# strings are matched too, so that "//" inside of them is left alone
+COMMENT_RE = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.S)
+TRAILING_COMMA_RE = re.compile(r'("(?:\\.|[^"\\])*")|,(?=\s*[}\]])')
+
+
+def _keep_strings(match):
+    return match.group(1) or ' '
+
+
+def loads(text):
+    """Parse sublime flavoured JSON."""
+    text = COMMENT_RE.sub(_keep_strings, text)
+    text = TRAILING_COMMA_RE.sub(_keep_strings, text)
+    return json.loads(text)
+
+
+def load(path):
+    """Read a sublime settings (or project) file."""
+    with open(path, 'rb') as fp:
+        return loads(fp.read().decode('utf-8'))
+
+
+def project_settings(path):
+    """Read the PyYapf section of a .sublime-project file."""
+    return load(path).get('settings', {}).get(PROJECT_KEY, {})
+
+
+class Settings(object):
+    """Layers of settings, later layers win."""
+
+    def __init__(self, layers=()):
+        """`layers` are dicts, from lowest to highest priority."""
+        self.layers = list(layers)
+
+    def get(self, key, default_value=None):
+        """Retrieve a key from the settings."""
+        for layer in reversed(self.layers):
+            if key in layer:
+                value = layer[key]
+                break
+        else:
+            value = None
+        return default_value if value is None else value
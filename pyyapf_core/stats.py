@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of formatting stages and rolling latency statistics.
+"""
+import collections
+import contextlib
+import threading
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 (sublime text 2)
+    from backports.ordereddict import OrderedDict
+
+# time.monotonic is python >= 3.3
+clock = getattr(time, 'monotonic', time.time)
+
+
+class Timings(object):
+    """Time spent in the stages of a single format."""
+
+    def __init__(self):
+        """Start the clock."""
+        self.start = clock()
+        self.stages = OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage (stages may be entered more than once)."""
+        start = clock()
+        try:
+            yield
+        finally:
+            self.add(name, clock() - start)
+
+    def add(self, name, seconds):
+        """Add time to a stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        """Time since the clock was started."""
+        return clock() - self.start
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of a non-empty list of values."""
+    values = sorted(values)
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+class LatencyStats(object):
+    """The last `window` timings per scope (e.g. view or engine) and stage."""
+
+    def __init__(self, window=100):
+        """Start out empty."""
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, scope, timings, total):
+        """Add the stages of a Timings (plus its total) to `scope`."""
+        with self.lock:
+            stages = self.samples.setdefault(scope, OrderedDict())
+            items = list(timings.stages.items()) + [('total', total)]
+            for stage, seconds in items:
+                samples = stages.get(stage)
+                if samples is None:
+                    samples = stages[stage] = collections.deque(
+                        maxlen=self.window
+                    )
+                samples.append(seconds)
+
+    def forget(self, scope):
+        """Drop the samples of a scope."""
+        with self.lock:
+            self.samples.pop(scope, None)
+
+    def summary(self):
+        """
+        Return {scope: [(stage, count, p50, p95, max)]}.
+
+        Times are in seconds, scopes and stages keep their recording order.
+        """
+        with self.lock:
+            result = OrderedDict()
+            for scope, stages in sorted(self.samples.items()):
+                result[scope] = [
+                    (
+                        stage, len(samples), percentile(samples, 0.5),
+                        percentile(samples, 0.95), max(samples)
+                    )
+                    for stage, samples in stages.items()
+                ]
+            return result
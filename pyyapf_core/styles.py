@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Find the yapf style that applies to a directory.
+
+This mirrors yapf's own lookup (see yapf --help): the nearest directory
+containing a `.style.yapf`, a `setup.cfg` with a [yapf] section or a
+`pyproject.toml` with a [tool.yapf] section (checked in that order) wins,
+then `~/.config/yapf/style`, then pep8.  Results are cached per directory
+and revalidated by mtime, so that looking up the style of a file deep in a
+project does not read every configuration file above it again.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# candidate file name -> pattern its content must match (None: any content)
+CANDIDATES = [
+    ('.style.yapf', None),
+    ('setup.cfg', re.compile(r'^\s*\[yapf\]', re.M)),
+    ('pyproject.toml', re.compile(r'^\s*\[tool\.yapf\]', re.M)),
+]
+
+USER_STYLE = os.path.join('~', '.config', 'yapf', 'style')
+
+DEFAULT_STYLE = 'pep8'
+
+# os.replace is python >= 3.3, os.rename replaces files too except on windows
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _mtime(path):
+    """Modification time of path, None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _contains(path, pattern):
+    """Does the file at path match pattern?"""
+    try:
+        with open(path, 'rb') as fp:
+            content = fp.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return False
+    return pattern.search(content) is not None
+
+
+class StyleFinder(object):
+    """
+    Cached lookup of the style file for a directory.
+
+    `candidates` are (file name, pattern) pairs like CANDIDATES, the
+    `user_style` file (None: there is none) and then the `default` style
+    apply if no candidate is found.
+    """
+
+    def __init__(
+        self, candidates=CANDIDATES, user_style=USER_STYLE,
+        default=DEFAULT_STYLE
+    ):
+        """Start out empty."""
+        self.candidates = candidates
+        self.user_style = user_style
+        self.default = default
+        # directory -> (style, [(path, mtime)] the result depends on)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def find(self, directory):
+        """
+        Return (style, mtime) for files in `directory`.
+
+        `style` is the path of a style file or the default style, `mtime`
+        changes whenever the style file does.
+        """
+        with self.lock:
+            style, depends = self.resolve(
+                os.path.abspath(directory) if directory else None
+            )
+        for path, mtime in depends:
+            if path == style:
+                return style, mtime
+        return style, None
+
+    def resolve(self, directory):
+        """Lookup `directory` (or the user's style for None), with caching."""
+        entry = self.entries.get(directory)
+        if entry is not None and all(
+            _mtime(path) == mtime for path, mtime in entry[1]
+        ):
+            return entry
+
+        if directory is None:
+            entry = self.resolve_user()
+        else:
+            entry = self.resolve_directory(directory)
+        self.entries[directory] = entry
+        return entry
+
+    def resolve_user(self):
+        """Fall back to the user's style file, or the default."""
+        if self.user_style is None:
+            return self.default, []
+        path = os.path.expanduser(self.user_style)
+        mtime = _mtime(path)
+        return (path if mtime is not None else self.default), [(path, mtime)]
+
+    def resolve_directory(self, directory):
+        """Look for a style file in `directory`, then in its parents."""
+        # creating or deleting a candidate changes the directory's mtime
+        depends = [(directory, _mtime(directory))]
+        for name, pattern in self.candidates:
+            path = os.path.join(directory, name)
+            mtime = _mtime(path)
+            if mtime is None:
+                continue
+            # a candidate without a yapf section may gain one later
+            depends.append((path, mtime))
+            if pattern is None or _contains(path, pattern):
+                return path, depends
+
+        parent = os.path.dirname(directory)
+        style, parent_depends = self.resolve(
+            parent if parent != directory else None
+        )
+        return style, depends + parent_depends
+
+
+def save_style_to_cache(style, directory):
+    """
+    Build yapf style config file named after its content.
+
+    The file is only written if it does not exist yet, so it can be shared
+    by all formats using the same style.  It is written to a temporary file
+    first, so that nobody reads it half-written.
+    """
+    cfg = configparser.RawConfigParser()
+    cfg.add_section('style')
+    for key in sorted(style):
+        cfg.set('style', key, style[key])
+    buf = StringIO()
+    cfg.write(buf)
+    content = buf.getvalue()
+
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    fname = os.path.join(directory, 'style-%s.cfg' % digest)
+    if os.path.exists(fname):
+        return fname
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+    fd, temp = tempfile.mkstemp(suffix='.tmp', prefix='style-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        _replace(temp, fname)
+    except (IOError, OSError):
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        # without os.replace, another thread may have been first
+        if not os.path.exists(fname):
+            raise
+    return fname
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Checking python syntax before running yapf.
+"""
+import ast
+
+
+def syntax_error(text):
+    """
+    Compile text (without running it) to find syntax errors.
+
+    Returns (line, column, message) for the first error or None.  `column`
+    is 1-based like yapf's and may be None.
+    """
+    try:
+        compile(text, '<stdin>', 'exec', ast.PyCF_ONLY_AST, True)
+    except SyntaxError as err:
+        message = '%s: %s' % (type(err).__name__, err.msg)
+        return err.lineno or 1, err.offset or None, message
+    except (ValueError, TypeError, MemoryError, RuntimeError):
+        # null bytes, too deeply nested, ...: leave it to yapf
+        return None
+    return None
+
+
+def syntax_error_lines(text):
+    """
+    Report a syntax error in text like yapf would, as err_lines.
+
+    Returns None if there is none.
+    """
+    error = syntax_error(text)
+    if error is None:
+        return None
+    line, column, msg = error
+    return ['<stdin>:%d:%d: %s' % (line, column or 0, msg)]
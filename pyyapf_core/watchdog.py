@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Deadlines (and cancellation) for yapf processes.
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+
+class Killed(Exception):
+    """A process was killed by its watchdog (`reason` says why)."""
+
+    def __init__(self, reason):
+        """Remember why."""
+        Exception.__init__(self, reason)
+        self.reason = reason
+
+
+def session_kwargs():
+    """
+    Popen arguments that start a process in its own process group.
+
+    This way the process and everything it started can be killed at once.
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    if sys.version_info >= (3, 2):
+        return {'start_new_session': True}
+    return {'preexec_fn': os.setsid}
+
+
+def kill_tree(popen):
+    """Kill a process started with `session_kwargs` and its children."""
+    if popen.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            with open(os.devnull, 'wb') as devnull:
+                subprocess.call(
+                    ['taskkill', '/F', '/T', '/PID', str(popen.pid)],
+                    stdout=devnull,
+                    stderr=devnull
+                )
+        else:
+            os.killpg(popen.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if popen.poll() is None:
+        try:
+            popen.kill()
+        except OSError:
+            pass
+
+
+class Watchdog(object):
+    """
+    Kills the process it watches once it runs past a deadline.
+
+    `cancel` kills it right away (or as soon as it is started).  `fired`
+    is None, "timeout" or "cancelled".
+    """
+
+    def __init__(self, timeout=None):
+        """The deadline is `timeout` seconds after a process is watched."""
+        self.timeout = timeout
+        self.popen = None
+        self.timer = None
+        self.fired = None
+        self.lock = threading.Lock()
+
+    def watch(self, popen):
+        """Start watching a (just started) process."""
+        with self.lock:
+            self.popen = popen
+            if self.fired:
+                kill_tree(popen)
+            elif self.timeout:
+                self.timer = threading.Timer(
+                    self.timeout, self.fire, ('timeout', )
+                )
+                self.timer.daemon = True
+                self.timer.start()
+
+    def done(self):
+        """Stop watching (the process finished)."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.popen = None
+
+    def fire(self, reason):
+        """Kill the process."""
+        with self.lock:
+            if self.fired is None:
+                self.fired = reason
+            if self.popen is not None:
+                kill_tree(self.popen)
+
+    def cancel(self):
+        """Kill the process because the user asked for it."""
+        self.fire('cancelled')
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Long-lived yapf worker.
+
+This script is *not* run inside Sublime Text: it is started with the Python
+interpreter that has yapf installed and serves formatting requests over
+stdin/stdout so that interpreter startup and the yapf imports are only paid
+once.
+
+Every message (in both directions) is a frame consisting of the payload
+length in ASCII digits, a newline and a JSON encoded payload.
+
+Requests look like this:
+
+    {"source": "...", "style": "pep8", "cwd": "/path", "lines": [[1, 3]]}
+
+`style` may be a style name, a path to a style file or `null`, in which case
+the style is looked up relative to `cwd` just like `yapf` does when reading
+from stdin.  Responses are either `{"formatted": "...", "changed": true}` or
+`{"error": ["...", "..."]}` where the error is a list of lines as yapf would
+have printed them to stderr.
+
+`{"version": true}` asks for the version of yapf, the response is
+`{"version": "0.43.0"}`.
+"""
+from __future__ import print_function
+
+import json
+import os
+import sys
+import traceback
+
+
+def read_frame(stream):
+    """Read a single frame, return None on EOF."""
+    header = stream.readline()
+    if not header:
+        return None
+    payload = stream.read(int(header.strip()))
+    return json.loads(payload.decode('utf-8'))
+
+
+def write_frame(stream, message):
+    """Write a single frame and flush it."""
+    payload = json.dumps(message).encode('utf-8')
+    stream.write(('%d\n' % len(payload)).encode('ascii'))
+    stream.write(payload)
+    stream.flush()
+
+
+def format_request(request):
+    """Run yapf on a single request."""
+    from yapf.yapflib import file_resources, yapf_api
+
+    style = request.get('style')
+    if not style:
+        style = file_resources.GetDefaultStyleForDir(
+            request.get('cwd') or os.getcwd()
+        )
+
+    lines = request.get('lines')
+    if lines:
+        lines = [tuple(pair) for pair in lines]
+
+    formatted, changed = yapf_api.FormatCode(
+        request['source'],
+        filename=request.get('filename') or '<stdin>',
+        style_config=style,
+        lines=lines
+    )
+    return {'formatted': formatted, 'changed': changed}
+
+
+def version_request():
+    """Report the version of yapf."""
+    import yapf
+    return {'version': yapf.__version__}
+
+
+def handle_request(request):
+    """Run yapf on a request, turn any exception into an error response."""
+    try:
+        if request.get('version'):
+            return version_request()
+        return format_request(request)
+    except Exception:  # pylint: disable=broad-except
+        exc_type, exc_value = sys.exc_info()[:2]
+        error = ''.join(traceback.format_exception_only(exc_type, exc_value))
+        return {'error': error.rstrip('\n').splitlines()}
+
+
+def serve(stdin, stdout):
+    """Answer requests until stdin is closed."""
+    while True:
+        request = read_frame(stdin)
+        if request is None:
+            return
+        write_frame(stdout, handle_request(request))
+
+
+def main():
+    """Entry point, wire up binary stdin/stdout."""
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+
+    # anything yapf (or a plugin of it) prints must not corrupt the protocol
+    sys.stdout = sys.stderr
+
+    # fail early (and visibly) if yapf is not importable
+    import yapf  # noqa: F401 pylint: disable=unused-import
+
+    serve(stdin, stdout)
+
+
+if __name__ == '__main__':
+    main()
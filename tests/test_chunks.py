@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pyyapf_core.chunks.
+"""
+import unittest
+
+from pyyapf_core.chunks import (
+    join_chunks, seam_blank_lines, split_chunks, split_points,
+    top_level_block
+)
+
+
+def module(count):
+    """A formatted module with `count` functions."""
+    return '\n\n'.join(
+        'def f%d(a):\n    return a + %d\n' % (i, i) for i in range(count)
+    )
+
+
+class SplitChunksTest(unittest.TestCase):
+
+    def test_concatenates_back(self):
+        text = 'import os\n\n\n' + module(20)
+        for count in range(2, 8):
+            chunks = split_chunks(text, count)
+            self.assertEqual(''.join(chunks), text)
+            self.assertTrue(1 < len(chunks) <= count)
+
+    def test_splits_between_definitions(self):
+        text = module(10)
+        for chunk in split_chunks(text, 4)[1:]:
+            self.assertTrue(chunk.startswith('def '))
+
+    def test_keeps_decorators(self):
+        text = module(3) + '\n\n@decorator\ndef g():\n    pass\n'
+        self.assertEqual(split_points(text)[-1], text.splitlines().index('@decorator'))
+
+    def test_keeps_comments_with_the_next_definition(self):
+        text = 'def a():\n    pass\n\n\n# about b\ndef b():\n    pass\n'
+        self.assertEqual(split_points(text), [])
+        self.assertIsNone(split_chunks(text, 2))
+
+    def test_only_between_definitions(self):
+        text = 'def a():\n    pass\n\n\nx = 1\n\n\ndef b():\n    pass\n'
+        self.assertEqual(split_points(text), [])
+
+    def test_unsplittable(self):
+        self.assertIsNone(split_chunks(module(10), 1))
+        self.assertIsNone(split_chunks('def a(:\n    pass\n' + module(10), 4))
+        self.assertIsNone(split_chunks('# yapf: disable\n' + module(10), 4))
+        self.assertIsNone(split_chunks(module(1), 4))
+
+
+class JoinChunksTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        text = module(12)
+        for count in range(2, 6):
+            self.assertEqual(join_chunks(split_chunks(text, count), 2), text)
+
+    def test_normalizes_blank_lines(self):
+        self.assertEqual(
+            join_chunks(['def a():\n    pass\n\n\n\n', '\ndef b():\n    pass'], 2),
+            'def a():\n    pass\n\n\ndef b():\n    pass\n'
+        )
+
+    def test_rejects_bad_chunks(self):
+        self.assertIsNone(join_chunks(['def a():\n    pass\n', ''], 2))
+        self.assertIsNone(join_chunks(['def a():\n', '    pass\n'], 2))
+
+    def test_seam_blank_lines(self):
+        self.assertEqual(
+            seam_blank_lines('def a():\n    pass\n\n\ndef b():\n    pass\n'), 2
+        )
+        self.assertEqual(
+            seam_blank_lines('def a():\n    pass\ndef b():\n    pass\n'), 0
+        )
+
+
+class TopLevelBlockTest(unittest.TestCase):
+
+    def test_blocks(self):
+        text = 'import os\n\n\ndef f():\n    return 1\n\n# note\n\nx = 2\n'
+        self.assertEqual(top_level_block(text, 0), (0, 1))
+        self.assertEqual(top_level_block(text, 4), (3, 5))
+        self.assertEqual(top_level_block(text, 8), (8, 9))
+
+    def test_outside_of_statements(self):
+        text = 'import os\n\n\ndef f():\n    return 1\n\n# note\n\nx = 2\n'
+        self.assertIsNone(top_level_block(text, 6))
+        self.assertIsNone(top_level_block('def f(:\n', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
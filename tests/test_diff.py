@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pyyapf_core.diff.
+"""
+import random
+import unittest
+
+from pyyapf_core.diff import changed_regions, hunks, map_point
+
+
+def apply_hunks(old, edits):
+    """Apply the edits returned by hunks, in the order given."""
+    for begin, end, text in edits:
+        old = old[:begin] + text + old[end:]
+    return old
+
+
+class HunksTest(unittest.TestCase):
+
+    def check(self, old, new):
+        edits = hunks(old, new)
+        self.assertEqual(apply_hunks(old, edits), new)
+        return edits
+
+    def test_identical(self):
+        self.assertEqual(hunks('a\nb\n', 'a\nb\n'), [])
+        self.assertEqual(hunks('', ''), [])
+
+    def test_single_line(self):
+        old = ''.join('line %d\n' % i for i in range(100))
+        new = old.replace('line 50\n', 'line fifty\n')
+        self.assertEqual(self.check(old, new), [
+            (old.index('line 50\n'), old.index('line 51\n'), 'line fifty\n')
+        ])
+
+    def test_back_to_front(self):
+        old = 'a\nb\nc\nd\ne\n'
+        edits = self.check(old, 'A\nb\nc\nd\nE\n')
+        self.assertEqual(len(edits), 2)
+        self.assertTrue(edits[0][0] > edits[1][0])
+
+    def test_insert_and_delete(self):
+        self.check('a\nb\nc\n', 'a\nx\ny\nb\nc\n')
+        self.check('a\nb\nc\n', 'a\nc\n')
+        self.check('a\nb\nc\n', '')
+        self.check('', 'a\nb\n')
+
+    def test_missing_trailing_newline(self):
+        self.check('a\nb', 'a\nb\n')
+        self.check('a\nb\n', 'a\nb')
+        self.check('x = 1', 'x = 2')
+
+    def test_repeated_lines(self):
+        old = 'pass\n' * 10 + 'x\n' + 'pass\n' * 10
+        self.check(old, old.replace('x\n', 'y\n'))
+        self.check(old, 'pass\n' * 5 + 'x\n' + 'pass\n' * 15)
+
+    def test_random(self):
+        rng = random.Random(42)
+        words = ['a\n', 'b\n', 'c\n', 'pass\n', '\n', 'x = 1\n']
+        for _ in range(500):
+            old = [rng.choice(words) for _ in range(rng.randint(0, 30))]
+            new = list(old)
+            for _ in range(rng.randint(0, 5)):
+                pos = rng.randint(0, len(new))
+                action = rng.random()
+                if action < 0.4:
+                    new.insert(pos, rng.choice(words))
+                elif action < 0.7 and pos < len(new):
+                    del new[pos]
+                elif pos < len(new):
+                    new[pos] = rng.choice(words)
+            if rng.random() < 0.2 and new:
+                new[-1] = new[-1].rstrip('\n')
+            self.check(''.join(old), ''.join(new))
+
+
+class MapPointTest(unittest.TestCase):
+
+    def test_before(self):
+        self.assertEqual(map_point(3, 5, 2, 10), 3)
+        self.assertEqual(map_point(5, 5, 2, 10), 5)
+
+    def test_after(self):
+        self.assertEqual(map_point(7, 5, 2, 10), 15)
+        self.assertEqual(map_point(20, 5, 10, 2), 12)
+
+    def test_inside(self):
+        self.assertEqual(map_point(6, 5, 4, 10), 6)
+        # the replacement is shorter, clamp to its end
+        self.assertEqual(map_point(8, 5, 4, 1), 6)
+
+    def test_follows_edits(self):
+        old = 'a\nbb\nc\nddd\n'
+        new = 'a\nb\nc\nd\n'
+        point = old.index('c')
+        for begin, end, text in hunks(old, new):
+            point = map_point(point, begin, end - begin, len(text))
+        self.assertEqual(point, new.index('c'))
+
+
+class ChangedRegionsTest(unittest.TestCase):
+
+    def apply(self, text, changes):
+        for begin, end, new in changes:
+            text = text[:begin] + new + text[end:]
+        return text
+
+    def test_single(self):
+        self.assertEqual(changed_regions([(2, 4, 'abc')]), [(2, 5)])
+        self.assertEqual(changed_regions([(2, 4, '')]), [(2, 2)])
+
+    def test_later_changes_shift_earlier_ones(self):
+        changes = [(10, 10, 'xyz'), (0, 2, ''), (20, 20, 'q')]
+        self.assertEqual(changed_regions(changes), [(8, 11), (0, 0), (20, 21)])
+
+    def test_inserted_text_is_found(self):
+        text = 'a = 1\nb = 2\nc = 3\nd = 4\n'
+        changes = [(4, 5, 'one'), (16, 17, 'three'), (0, 1, 'alpha')]
+        result = self.apply(text, changes)
+        for (begin, end), (_, _, new) in zip(changed_regions(changes), changes):
+            self.assertEqual(result[begin:end], new)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pyyapf_core.ranges.
+"""
+import unittest
+
+from pyyapf_core.ranges import merge_ranges, subtract_ranges
+
+
+class MergeRangesTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(merge_ranges([]), [])
+
+    def test_sorted(self):
+        self.assertEqual(merge_ranges([(5, 6), (1, 2)]), [(1, 2), (5, 6)])
+
+    def test_overlapping(self):
+        self.assertEqual(merge_ranges([(1, 4), (3, 6)]), [(1, 6)])
+        self.assertEqual(merge_ranges([(1, 10), (3, 6)]), [(1, 10)])
+
+    def test_adjacent(self):
+        self.assertEqual(merge_ranges([(1, 2), (3, 4)]), [(1, 4)])
+        self.assertEqual(merge_ranges([(1, 2), (4, 5)]), [(1, 2), (4, 5)])
+
+    def test_single_lines(self):
+        self.assertEqual(merge_ranges([(3, 3), (3, 3), (4, 4)]), [(3, 4)])
+
+
+class SubtractRangesTest(unittest.TestCase):
+
+    def test_nothing_removed(self):
+        self.assertEqual(subtract_ranges([(1, 5)], []), [(1, 5)])
+        self.assertEqual(subtract_ranges([(1, 5)], [(7, 9)]), [(1, 5)])
+
+    def test_everything_removed(self):
+        self.assertEqual(subtract_ranges([(3, 5)], [(1, 10)]), [])
+        self.assertEqual(subtract_ranges([(3, 5)], [(3, 5)]), [])
+
+    def test_split(self):
+        self.assertEqual(subtract_ranges([(1, 10)], [(4, 6)]), [(1, 3), (7, 10)])
+
+    def test_edges(self):
+        self.assertEqual(subtract_ranges([(1, 10)], [(1, 3)]), [(4, 10)])
+        self.assertEqual(subtract_ranges([(1, 10)], [(8, 12)]), [(1, 7)])
+
+    def test_several(self):
+        self.assertEqual(
+            subtract_ranges([(1, 5), (10, 20)], [(2, 2), (4, 11), (15, 16)]),
+            [(1, 1), (3, 3), (12, 14), (17, 20)]
+        )
+
+    def test_unmerged_input(self):
+        self.assertEqual(
+            subtract_ranges([(5, 8), (1, 4)], [(3, 3), (2, 2)]), [(1, 1), (4, 8)]
+        )
+
+    def test_matches_sets(self):
+        ranges = [(1, 3), (6, 12), (15, 15), (18, 30)]
+        removed = [(2, 7), (11, 16), (20, 20), (25, 40)]
+        expected = set()
+        for start, end in ranges:
+            expected.update(range(start, end + 1))
+        for start, end in removed:
+            expected.difference_update(range(start, end + 1))
+        result = set()
+        for start, end in subtract_ranges(ranges, removed):
+            result.update(range(start, end + 1))
+        self.assertEqual(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
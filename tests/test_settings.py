@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pyyapf_core.settings.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyyapf_core.settings import (
+    DEFAULT_SETTINGS, PROJECT_KEY, Settings, load, loads, project_settings
+)
+
+
+class LoadsTest(unittest.TestCase):
+
+    def test_plain_json(self):
+        self.assertEqual(loads('{"a": [1, 2], "b": null}'), {
+            'a': [1, 2],
+            'b': None
+        })
+
+    def test_line_comments(self):
+        text = '{\n  // a comment\n  "a": 1, // another\n  "b": 2\n}'
+        self.assertEqual(loads(text), {'a': 1, 'b': 2})
+
+    def test_block_comments(self):
+        text = '{\n  /*\n  "a": 1,\n  */\n  "b": /* inline */ 2\n}'
+        self.assertEqual(loads(text), {'b': 2})
+
+    def test_comments_in_strings(self):
+        text = '{"url": "http://example.com", "glob": "/*.py", "c": "*/"}'
+        self.assertEqual(loads(text), {
+            'url': 'http://example.com',
+            'glob': '/*.py',
+            'c': '*/'
+        })
+
+    def test_escaped_quotes(self):
+        text = r'{"a": "say \"//hi\"", // comment' + '\n"b": 1}'
+        self.assertEqual(loads(text), {'a': 'say "//hi"', 'b': 1})
+
+    def test_trailing_commas(self):
+        text = '{"a": [1, 2,], "b": {"c": 3,},\n}'
+        self.assertEqual(loads(text), {'a': [1, 2], 'b': {'c': 3}})
+
+    def test_commas_in_strings(self):
+        self.assertEqual(loads('{"a": ",]", "b": ",}",}'), {
+            'a': ',]',
+            'b': ',}'
+        })
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, loads, '{"a": }')
+
+    def test_default_settings(self):
+        settings = load(DEFAULT_SETTINGS)
+        self.assertEqual(settings['formatter'], 'yapf')
+        self.assertNotIn('config', settings)
+
+
+class ProjectSettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, content):
+        path = os.path.join(self.root, 'test.sublime-project')
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return path
+
+    def test_section(self):
+        path = self.write(json.dumps({
+            'folders': [{'path': '.'}],
+            'settings': {PROJECT_KEY: {'formatter': 'ruff'}, 'tab_size': 4}
+        }))
+        self.assertEqual(project_settings(path), {'formatter': 'ruff'})
+
+    def test_no_section(self):
+        self.assertEqual(project_settings(self.write('{"folders": [],}')), {})
+
+
+class SettingsTest(unittest.TestCase):
+
+    def test_later_layers_win(self):
+        settings = Settings([{'a': 1, 'b': 1}, {'b': 2}])
+        self.assertEqual(settings.get('a'), 1)
+        self.assertEqual(settings.get('b'), 2)
+
+    def test_default_value(self):
+        settings = Settings([{'a': 1}])
+        self.assertIsNone(settings.get('missing'))
+        self.assertEqual(settings.get('missing', 3), 3)
+
+    def test_none_is_unset(self):
+        # like sublime: a null value falls back to the default value
+        settings = Settings([{'a': 1}, {'a': None}])
+        self.assertEqual(settings.get('a', 3), 3)
+        self.assertIsNone(settings.get('a'))
+
+    def test_no_layers(self):
+        self.assertEqual(Settings().get('a', 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pyyapf_core.styles.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pyyapf_core.styles import StyleFinder, save_style_to_cache
+
+
+class StyleFinderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sub = os.path.join(self.root, 'sub')
+        os.mkdir(self.sub)
+        self.finder = StyleFinder(user_style=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content, directory=None):
+        path = os.path.join(directory or self.root, name)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return path
+
+    def test_default(self):
+        self.assertEqual(self.finder.find(self.sub), ('pep8', None))
+
+    def test_yapf_order(self):
+        # like yapf: .style.yapf, then setup.cfg, then pyproject.toml
+        self.write('pyproject.toml', '[tool.yapf]\nbased_on_style = google\n')
+        setup_cfg = self.write('setup.cfg', '[yapf]\nbased_on_style = google\n')
+        self.assertEqual(self.finder.find(self.sub)[0], setup_cfg)
+        style_yapf = self.write('.style.yapf', '[style]\n')
+        self.assertEqual(StyleFinder().find(self.sub)[0], style_yapf)
+
+    def test_section_required(self):
+        self.write('setup.cfg', '[flake8]\n')
+        pyproject = self.write('pyproject.toml', '[tool.yapf]\n')
+        self.assertEqual(self.finder.find(self.sub)[0], pyproject)
+
+    def test_nearest_directory_wins(self):
+        self.write('.style.yapf', '[style]\n')
+        nearer = self.write('setup.cfg', '[yapf]\n', self.sub)
+        self.assertEqual(self.finder.find(self.sub)[0], nearer)
+
+
+class SaveStyleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.directory = os.path.join(self.root, 'styles')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_named_after_content(self):
+        first = save_style_to_cache({'column_limit': '80'}, self.directory)
+        second = save_style_to_cache({'column_limit': '80'}, self.directory)
+        other = save_style_to_cache({'column_limit': '100'}, self.directory)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        with open(first) as fp:
+            self.assertEqual(fp.read(), '[style]\ncolumn_limit = 80\n\n')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_concurrent(self):
+        style = {'based_on_style': 'pep8', 'indent_width': '2'}
+        results = []
+
+        def save():
+            results.append(save_style_to_cache(style, self.directory))
+
+        threads = [threading.Thread(target=save) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(os.listdir(self.directory), [
+            os.path.basename(results[0])
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()